@@ -1,5 +1,6 @@
 import os
-import pandas as pd
+import sys
+import argparse
 import matplotlib.pyplot as plt
 import seaborn as sns
 
@@ -13,92 +14,112 @@ import seaborn as sns
 # Get the absolute path to the CSV based on this script's location
 # Get the absolute path to the CSV inside code/ folder
 script_dir = os.path.dirname(os.path.abspath(__file__))  # folder of this script
-csv_path = os.path.join(script_dir, '..', 'code', 'parking_data.csv')  # code/ folder
-
-# Load CSV with error handling
-try:
-    df = pd.read_csv(csv_path)
-    print(f"CSV loaded successfully from: {csv_path}")
-except FileNotFoundError:
-    print(f"CSV not found! Checked path: {csv_path}")
-    raise
-
+code_dir = os.path.join(script_dir, '..', 'code')
+csv_path = os.path.join(code_dir, 'parking_data.csv')  # code/ folder
 
+sys.path.insert(0, code_dir)
+from data_loader import aggregate_chunks, regroup, parse_time
 
-# Convert timestamp to datetime
-# df['timestamp'] = pd.to_datetime(df['timestamp'])
-df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-df = df.dropna(subset=['timestamp'])  # optional, removes any invalid timestamps
+# Optional time window, e.g. --start=-7d or --start 2026-01-05 --end 2026-01-12
+parser = argparse.ArgumentParser(description='Peak hours, slot utilization and day/hour heatmap')
+parser.add_argument('--start', help="Only rows from this time: ISO timestamp or relative like --start=-7d")
+parser.add_argument('--end', help='Only rows up to this time')
+args = parser.parse_args()
+start, end = parse_time(args.start), parse_time(args.end)
 
+if not os.path.exists(csv_path):
+    print(f"CSV not found! Checked path: {csv_path}")
+    raise FileNotFoundError(csv_path)
+print(f"Streaming CSV from: {csv_path}")
 
-# Extract hour and day for analysis
-# df['hour'] = df['timestamp'].dt.hour
-# df['day'] = df['timestamp'].dt.day_name()
-# Round timestamp to nearest 5-minute interval
-df['time_5min'] = df['timestamp'].dt.floor('5T')  # '5T' = 5-minute intervals
-
-# For day labels
-df['day'] = df['timestamp'].dt.day_name()
+# The history is streamed once, chunk by chunk, into 5-minute buckets (so it never
+# has to fit in memory); the hourly and day/hour tables are combined from those.
+# Rows with unparseable timestamps are dropped.
+buckets_5min = aggregate_chunks(csv_path, '5min', start=start, end=end)
 
-# Average occupancy per 5-minute interval
-peak_5min = df.groupby('time_5min')['occupancy_percent'].mean()
-print("Peak 5-Minute Intervals (Average Occupancy %):")
-print(peak_5min)
+if buckets_5min.empty:
+    print("No occupancy data in the selected window. Skipping peak hours and heatmap.")
+else:
+    # Average occupancy per 5-minute interval
+    peak_5min = buckets_5min['mean']
+    print("Peak 5-Minute Intervals (Average Occupancy %):")
+    print(peak_5min)
 
 
 # -------------------------------
 # Step 2: Peak Hours Analysis
 # -------------------------------
-# Average occupancy by hour
-peak_hours = df.groupby('hour')['occupancy_percent'].mean()
-print("Peak Hours Analysis (Average Occupancy % per Hour):")
-print(peak_hours)
-
-# Plot Peak Hours
-plt.figure(figsize=(10,5))
-plt.plot(peak_hours.index, peak_hours.values, marker='o')
-plt.title("Average Parking Occupancy by Hour")
-plt.xlabel("Hour of Day")
-plt.ylabel("Average Occupancy (%)")
-plt.grid(True)
-plt.show()
+if not buckets_5min.empty:
+    # Average occupancy by hour
+    peak_hours = regroup(buckets_5min, buckets_5min.index.hour)['mean']
+    print("Peak Hours Analysis (Average Occupancy % per Hour):")
+    print(peak_hours)
+
+    # Plot Peak Hours
+    plt.figure(figsize=(10,5))
+    plt.plot(peak_hours.index, peak_hours.values, marker='o')
+    plt.title("Average Parking Occupancy by Hour")
+    plt.xlabel("Hour of Day")
+    plt.ylabel("Average Occupancy (%)")
+    plt.grid(True)
+    plt.show()
 
 # -------------------------------
 # Step 3: Slot / Zone Utilization
 # -------------------------------
-# Assuming you have per-slot occupancy column named 'slot_id' and 'occupied' (1=occupied,0=free)
-# If your CSV does not have per-slot data, skip this part
-if 'slot_id' in df.columns and 'occupied' in df.columns:
-    slot_usage = df.groupby('slot_id')['occupied'].mean()  # mean = fraction of time occupied
-    print("\nSlot Utilization (fraction of time occupied):")
-    print(slot_usage)
-
-    # Identify underutilized slots (<30% occupied)
-    underutilized = slot_usage[slot_usage < 0.3]
-    print("\nUnderutilized Slots (<30% occupied):")
-    print(underutilized)
-
-    # Bar chart of slot utilization
-    plt.figure(figsize=(12,5))
-    slot_usage.sort_values().plot(kind='bar', color='skyblue')
-    plt.title("Slot Utilization (Fraction of Time Occupied)")
-    plt.xlabel("Slot ID")
-    plt.ylabel("Occupancy Fraction")
-    plt.show()
+# Per-slot occupancy comes from the dense store main.py writes when
+# PARKING_SLOT_STORE is set (one uint8 per slot per frame, see engine.BinaryStoreSink)
+slot_store = os.environ.get('PARKING_SLOT_STORE', os.path.join(code_dir, 'slot_occupancy.bin'))
+if os.path.exists(slot_store) and os.path.getsize(slot_store) > 16:
+    from engine import load_binary_store
+    from slot_analytics import Transitions, slot_summary, lot_dwell_percentiles, underutilized
+
+    t_ms, occupancy = load_binary_store(slot_store)
+    # Records are in time order (epoch ms), so the window is a slice of the memory map
+    lo = t_ms.searchsorted(start.to_pydatetime().timestamp() * 1000) if start is not None else 0
+    hi = t_ms.searchsorted(end.to_pydatetime().timestamp() * 1000, side='right') if end is not None else len(t_ms)
+    t_ms, occupancy = t_ms[lo:hi], occupancy[lo:hi]
+    if len(t_ms) == 0:
+        print("\nNo slot occupancy data in the selected window. Skipping slot utilization analysis.")
+    else:
+        transitions = Transitions.from_dense(t_ms, occupancy)
+        slot_stats = slot_summary(transitions)
+        slot_usage = slot_stats['utilization']  # fraction of time occupied
+        print("\nSlot Utilization (fraction of time occupied):")
+        print(slot_usage)
+
+        print("\nDwell Time per Slot (seconds) and Turnover (arrivals per hour):")
+        print(slot_stats[['dwell_mean_s', 'dwell_p50_s', 'dwell_p90_s', 'turnover_per_hour']])
+        print("\nLot Dwell Time Percentiles (seconds):")
+        print(lot_dwell_percentiles(transitions))
+
+        # Identify underutilized slots (<30% occupied)
+        print("\nUnderutilized Slots (<30% occupied):")
+        print(underutilized(slot_stats, 0.3))
+
+        # Bar chart of slot utilization
+        plt.figure(figsize=(12,5))
+        slot_usage.sort_values().plot(kind='bar', color='skyblue')
+        plt.title("Slot Utilization (Fraction of Time Occupied)")
+        plt.xlabel("Slot ID")
+        plt.ylabel("Occupancy Fraction")
+        plt.show()
 else:
-    print("\nSlot-level occupancy data not available. Skipping slot utilization analysis.")
+    print("\nSlot-level occupancy data not available (run main.py with PARKING_SLOT_STORE set). "
+          "Skipping slot utilization analysis.")
 
 # -------------------------------
 # Step 4: Heatmap of Occupancy by Day and Hour
 # -------------------------------
-heatmap_data = df.pivot_table(index='day', columns='hour', values='occupancy_percent', aggfunc='mean')
-# Reorder days for readability
-days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-heatmap_data = heatmap_data.reindex(days_order)
-
-plt.figure(figsize=(12,6))
-sns.heatmap(heatmap_data, cmap='Reds', annot=True, fmt=".1f")
-plt.title("Heatmap of Parking Occupancy (%) by Day and Hour")
-plt.xlabel("Hour of Day")
-plt.ylabel("Day of Week")
-plt.show()
+if not buckets_5min.empty:
+    heatmap_data = regroup(buckets_5min, [buckets_5min.index.day_name(), buckets_5min.index.hour])['mean'].unstack()
+    # Reorder days for readability
+    days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    heatmap_data = heatmap_data.reindex(days_order)
+
+    plt.figure(figsize=(12,6))
+    sns.heatmap(heatmap_data, cmap='Reds', annot=True, fmt=".1f")
+    plt.title("Heatmap of Parking Occupancy (%) by Day and Hour")
+    plt.xlabel("Hour of Day")
+    plt.ylabel("Day of Week")
+    plt.show()
@@ -1,12 +1,14 @@
 import os
 import sys
+import argparse
 
 # Attempt to import required libraries
 try:
     import pandas as pd
     import matplotlib.pyplot as plt
-    import numpy as np
     from matplotlib.dates import DateFormatter
+    from data_loader import load_data as load_typed
+    from forecast import SeasonalForecaster
 except Exception as e:
     print(f"Missing Python packages for analytics: {e}")
     print("Install with: python -m pip install pandas matplotlib numpy")
@@ -19,18 +21,10 @@ def ensure_plots_dir(path="plots"):
     return out
 
 
-def load_data(csv_path):
-    df = pd.read_csv(csv_path)
-    # Try to parse timestamp column
-    if 'timestamp' in df.columns:
-        try:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        except Exception:
-            pass
-    # Ensure occupancy_percent is numeric
-    if 'occupancy_percent' in df.columns:
-        df['occupancy_percent'] = pd.to_numeric(df['occupancy_percent'], errors='coerce')
-    return df
+def load_data(csv_path, start=None, end=None):
+    # Only the columns the plots below use (samples weights rollup rows in the forecast)
+    return load_typed(csv_path, columns=['free_slots', 'occupied_slots', 'occupancy_percent', 'timestamp', 'samples'],
+                      start=start, end=end)
 
 
 def plot_occupancy_time(df, out_dir):
@@ -71,31 +65,28 @@ def plot_free_vs_occupied(df, out_dir):
     print('Saved', out_path)
 
 
-def plot_moving_average_and_forecast(df, out_dir, window=30, forecast_steps=30):
+def plot_moving_average_and_forecast(df, out_dir, window=30, forecast_minutes=60):
     series = df['occupancy_percent'].astype(float).reset_index(drop=True)
     if series.isna().all():
         print('No numeric occupancy_percent data available for moving average.')
         return
     ma = series.rolling(window=window, min_periods=1).mean()
 
-    # Simple linear regression forecast on last N points
-    n_fit = min(200, len(series))
-    x = np.arange(n_fit)
-    y = series.iloc[-n_fit:].values
-    coeffs = np.polyfit(x, y, 1)
-    poly = np.poly1d(coeffs)
-    # Predict next forecast_steps
-    x_forecast = np.arange(n_fit, n_fit + forecast_steps)
-    y_forecast = poly(x_forecast)
+    # Seasonal (day-of-week x time-of-day) profile trained on the whole history,
+    # plus the current deviation from it
+    forecaster = SeasonalForecaster()
+    forecaster.update_frame(df)
+    forecast = forecaster.forecast(forecast_minutes, step_minutes=1)
 
     plt.figure(figsize=(12, 5))
-    idx = np.arange(len(series))
-    plt.plot(idx, series, label='Occupancy % (raw)', alpha=0.4)
-    plt.plot(idx, ma, label=f'Moving Average (window={window})', linewidth=2)
-    # plot forecast appended after existing index
-    plt.plot(x_forecast, y_forecast, label='Linear Forecast', color='orange', linestyle='--')
-    plt.title('Moving Average and Simple Forecast of Occupancy %')
-    plt.xlabel('Frame index')
+    x = df['timestamp']
+    plt.plot(x, series, label='Occupancy % (raw)', alpha=0.4)
+    plt.plot(x, ma, label=f'Moving Average (window={window})', linewidth=2)
+    # plot forecast after the last timestamp
+    plt.plot(forecast.index, forecast.values, label='Seasonal Forecast', color='orange', linestyle='--')
+    plt.gcf().autofmt_xdate()
+    plt.title('Moving Average and Seasonal Forecast of Occupancy %')
+    plt.xlabel('Time')
     plt.ylabel('Occupancy (%)')
     plt.legend()
     plt.grid(alpha=0.3)
@@ -107,11 +98,16 @@ def plot_moving_average_and_forecast(df, out_dir, window=30, forecast_steps=30):
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Save occupancy plots for parking_data.csv')
+    parser.add_argument('--start', help="Only rows from this time: ISO timestamp or relative like --start=-1d")
+    parser.add_argument('--end', help='Only rows up to this time')
+    args = parser.parse_args()
+
     csv_path = os.path.join(os.path.dirname(__file__), 'parking_data.csv')
     if not os.path.exists(csv_path):
         print('parking_data.csv not found at', csv_path)
         sys.exit(1)
-    df = load_data(csv_path)
+    df = load_data(csv_path, args.start, args.end)
     out_dir = ensure_plots_dir('plots')
     # Basic checks
     if 'occupancy_percent' not in df.columns or df['occupancy_percent'].dropna().empty:
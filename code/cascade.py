@@ -0,0 +1,319 @@
+import sys
+import glob
+import time
+import argparse
+import warnings
+
+import cv2
+import numpy as np
+
+# Where each slot's label came from
+SOURCE_GATE = 0     # too dark/bright to judge, marked occupied
+SOURCE_TIER1 = 1    # decided by the cheap per-slot statistics
+SOURCE_MODEL = 2    # sent to the pickled classifier
+
+# Brightness gate from main.py: mean crop intensity outside this range is not judged
+DARK_LIMIT = 20
+BRIGHT_LIMIT = 240
+
+CANNY_LOW, CANNY_HIGH = 50, 150
+# Weight of the grey-level spread against edge density in the tier-1 score
+STD_SCALE = 64.0
+# Learning rate of the empty-slot reference
+REFERENCE_RATE = 0.05
+# Fraction of tier-1 decisions re-checked by the model each frame while learning,
+# so references and calibration samples keep tracking slow changes (e.g. dusk)
+AUDIT_FRACTION = 0.02
+
+
+def model_input(crop):
+    """Flattened 15x15x3 crop, exactly as the model was trained"""
+    from skimage.transform import resize
+    return resize(crop, (15, 15, 3)).flatten()
+
+
+def _box_sums(integral, x0, y0, x1, y1):
+    return integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+
+
+class CascadeClassifier:
+    """
+    Two-tier slot classifier.
+
+    Tier 1 computes, for all slots at once from integral images, the mean
+    intensity (brightness gate), grey-level standard deviation and Canny edge
+    density, and scores each slot by how far those are from a learned empty-slot
+    reference. Slots whose score is clearly below (empty) or above (occupied) their
+    own calibrated thresholds are decided there; only the rest go to the model,
+    in a single batched predict call.
+
+    Thresholds start out undecidable (everything goes to the model) and are
+    calibrated per slot from the model's own recent labels. While learning, a
+    random `audit` fraction of the tier-1 decisions also goes to the model, so
+    slots tier 1 has taken over keep contributing fresh labelled samples.
+    """
+
+    def __init__(self, model, parking_spots, history=256, min_samples=20, quantile=0.02, recalibrate_every=500,
+                 audit=AUDIT_FRACTION, seed=None):
+        self.model = model
+        self.audit = audit
+        self.rng = np.random.default_rng(seed)
+        self.spots = list(parking_spots)
+        boxes = np.array(self.spots, dtype=np.int64).reshape(-1, 4)
+        self.x0, self.y0 = boxes[:, 0], boxes[:, 1]
+        self.x1, self.y1 = boxes[:, 0] + boxes[:, 2], boxes[:, 1] + boxes[:, 3]
+        self.area = (boxes[:, 2] * boxes[:, 3]).astype(np.float64)
+
+        n = len(self.spots)
+        self.ref_std = np.full(n, np.nan)
+        self.ref_edge = np.full(n, np.nan)
+        self.empty_below = np.full(n, -np.inf)
+        self.occupied_above = np.full(n, np.inf)
+
+        # Ring of recent (std, edge, model label) observations per slot for calibration
+        self.history = history
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.recalibrate_every = recalibrate_every
+        self.sample_std = np.zeros((n, history), dtype=np.float32)
+        self.sample_edge = np.zeros((n, history), dtype=np.float32)
+        self.sample_label = np.full((n, history), -1, dtype=np.int8)
+        self.sample_pos = np.zeros(n, dtype=np.int64)
+        self.frames_seen = 0
+
+    def slot_features(self, frame):
+        """
+        Per-slot (mean intensity over all channels, grey std, edge density) arrays
+        """
+        x0, y0, x1, y1 = self.x0, self.y0, self.x1, self.y1
+        # Integer sums divided by the count give the same value as np.mean(crop)
+        color_sum = _box_sums(cv2.integral(frame), x0, y0, x1, y1).sum(axis=1)
+        mean = color_sum / (self.area * frame.shape[2])
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        g_sum, g_sqsum = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        g_mean = _box_sums(g_sum, x0, y0, x1, y1) / self.area
+        g_var = _box_sums(g_sqsum, x0, y0, x1, y1) / self.area - g_mean ** 2
+        std = np.sqrt(np.maximum(g_var, 0.0))
+
+        edges = cv2.Canny(gray, CANNY_LOW, CANNY_HIGH)
+        edge = _box_sums(cv2.integral(edges), x0, y0, x1, y1) / (255.0 * self.area)
+        return mean, std, edge
+
+    def score(self, std, edge):
+        """Distance from the empty-slot reference (nan until a reference exists)"""
+        return np.abs(edge - self.ref_edge) + np.abs(std - self.ref_std) / STD_SCALE
+
+    def _tier1(self, frame, audit=0.0):
+        mean, std, edge = self.slot_features(frame)
+        labels = np.ones(len(self.spots), dtype=np.uint8)
+        sources = np.full(len(self.spots), SOURCE_GATE, dtype=np.uint8)
+
+        judged = (mean >= DARK_LIMIT) & (mean <= BRIGHT_LIMIT)
+        with np.errstate(invalid='ignore'):
+            s = self.score(std, edge)
+            tier1_empty = judged & (s < self.empty_below)
+            tier1_occupied = judged & (s > self.occupied_above)
+        labels[tier1_empty] = 0
+        sources[tier1_empty | tier1_occupied] = SOURCE_TIER1
+        to_model = judged & ~tier1_empty & ~tier1_occupied
+        if audit > 0:
+            # The model's label replaces tier 1's for audited slots
+            to_model |= (sources == SOURCE_TIER1) & (self.rng.random(len(sources)) < audit)
+        ambiguous = np.flatnonzero(to_model)
+        sources[ambiguous] = SOURCE_MODEL
+        return labels, sources, ambiguous, std, edge
+
+    def predict(self, frame, learn=True, valid=None):
+        """
+        Classify every slot of a frame.
+        Returns (labels, sources): labels 0 = empty, 1 = occupied; sources SOURCE_*.
+        See predict_batch for `valid`.
+        """
+        labels, sources = self.predict_batch([frame], learn=learn, valid=valid)
+        if labels is None:
+            return None, None
+        return labels[0], sources[0]
+
+    def predict_batch(self, frames, learn=True, valid=None):
+        """
+        Classify several frames with a single model call for all their ambiguous
+        (and, when learning, audited) slots.
+        Returns (labels, sources) arrays of shape (frames, slots).
+
+        `valid`, if given, is called once the frames have been read; if it returns
+        False (e.g. a frame bus slot was overwritten meanwhile) nothing is learned
+        and (None, None) is returned.
+        """
+        results = [self._tier1(frame, self.audit if learn else 0.0) for frame in frames]
+        crops = [model_input(frame[self.y0[i]:self.y1[i], self.x0[i]:self.x1[i]])
+                 for frame, (_, _, ambiguous, _, _) in zip(frames, results) for i in ambiguous]
+        predicted = self.model.predict(np.stack(crops)) if crops else np.empty(0)
+        if valid is not None and not valid():
+            return None, None
+
+        start = 0
+        for labels, sources, ambiguous, std, edge in results:
+            part = predicted[start:start + len(ambiguous)]
+            start += len(ambiguous)
+            labels[ambiguous] = np.where(part == 0, 0, 1)
+            if learn:
+                if len(ambiguous):
+                    self.observe(ambiguous, std[ambiguous], edge[ambiguous], labels[ambiguous])
+                self.frames_seen += 1
+                if self.recalibrate_every and self.frames_seen % self.recalibrate_every == 0:
+                    self.calibrate()
+        n = len(self.spots)
+        return (np.stack([r[0] for r in results]) if results else np.empty((0, n), dtype=np.uint8),
+                np.stack([r[1] for r in results]) if results else np.empty((0, n), dtype=np.uint8))
+
+    def observe(self, slots, std, edge, labels):
+        """Record model-labelled observations and track the empty-slot reference"""
+        pos = self.sample_pos[slots] % self.history
+        self.sample_std[slots, pos] = std
+        self.sample_edge[slots, pos] = edge
+        self.sample_label[slots, pos] = labels
+        self.sample_pos[slots] += 1
+
+        empty = labels == 0
+        slots, std, edge = slots[empty], std[empty], edge[empty]
+        fresh = np.isnan(self.ref_std[slots])
+        self.ref_std[slots] = np.where(fresh, std, self.ref_std[slots] + REFERENCE_RATE * (std - self.ref_std[slots]))
+        self.ref_edge[slots] = np.where(fresh, edge, self.ref_edge[slots] + REFERENCE_RATE * (edge - self.ref_edge[slots]))
+
+    def calibrate(self):
+        """
+        Set each slot's thresholds from its recorded history. With `occ_low` the low
+        quantile of occupied scores and `empty_high` the high quantile of empty scores,
+        a slot is decided empty below min(occ_low, empty_high) and occupied above
+        max(occ_low, empty_high); the band in between always goes to the model.
+
+        A slot that has rarely been occupied (typically flat empty asphalt) uses the
+        occupied scores pooled over all slots; scores are relative to each slot's own
+        reference, so they are comparable across slots. Slots without enough empty
+        samples stay undecidable.
+        """
+        scores = np.abs(self.sample_edge - self.ref_edge[:, None]) + \
+            np.abs(self.sample_std - self.ref_std[:, None]) / STD_SCALE
+        occupied = self.sample_label == 1
+        empty = self.sample_label == 0
+        with warnings.catch_warnings():
+            # Slots with no samples of a class give all-nan rows
+            warnings.simplefilter('ignore', RuntimeWarning)
+            occ_low = np.nanquantile(np.where(occupied, scores, np.nan), self.quantile, axis=1)
+            empty_high = np.nanquantile(np.where(empty, scores, np.nan), 1 - self.quantile, axis=1)
+
+        pooled = scores[occupied & ~np.isnan(scores)]
+        if len(pooled) >= self.min_samples:
+            few_occ = occupied.sum(axis=1) < self.min_samples
+            occ_low[few_occ] = np.quantile(pooled, self.quantile)
+        else:
+            occ_low[:] = np.nan
+        usable = (empty.sum(axis=1) >= self.min_samples) & ~np.isnan(occ_low) & ~np.isnan(empty_high)
+        self.empty_below = np.where(usable, np.minimum(occ_low, empty_high), -np.inf)
+        self.occupied_above = np.where(usable, np.maximum(occ_low, empty_high), np.inf)
+
+    def save(self, path):
+        np.savez_compressed(path, spots=np.array(self.spots, dtype=np.int64).reshape(-1, 4), ref_std=self.ref_std, ref_edge=self.ref_edge,
+                            empty_below=self.empty_below, occupied_above=self.occupied_above,
+                            sample_std=self.sample_std, sample_edge=self.sample_edge,
+                            sample_label=self.sample_label, sample_pos=self.sample_pos)
+
+    def load(self, path):
+        """Restore a saved calibration; ignored if it was made for a different layout"""
+        data = np.load(path)
+        spots = np.array(self.spots, dtype=np.int64).reshape(-1, 4)
+        # Scores depend on the slot boxes, so a calibration made at another resolution is not reused
+        if data['ref_std'].shape != self.ref_std.shape or data['sample_std'].shape != self.sample_std.shape or \
+                ('spots' in data and not np.array_equal(data['spots'], spots)):
+            print(f"Calibration at {path} does not match the slot layout, ignoring it")
+            return False
+        for name in ('ref_std', 'ref_edge', 'empty_below', 'occupied_above',
+                     'sample_std', 'sample_edge', 'sample_label', 'sample_pos'):
+            setattr(self, name, data[name])
+        return True
+
+
+def iter_frames(pattern=None, video_path=None, count=200):
+    """Frames from image dumps (a glob, like debug_analysis.py's debug_frame.jpg) or a video"""
+    if pattern:
+        for path in sorted(glob.glob(pattern))[:count]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield frame
+        return
+    video = cv2.VideoCapture(video_path)
+    try:
+        for _ in range(count):
+            ret, frame = video.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        video.release()
+
+
+def report(model, parking_spots, frames, calibrate_frames=100):
+    """
+    Accuracy-versus-speed of the cascade against the model alone.
+    The first `calibrate_frames` frames only train the cascade; the rest are scored.
+    """
+    cascade = CascadeClassifier(model, parking_spots, recalibrate_every=0)
+    baseline = CascadeClassifier(model, parking_spots, recalibrate_every=0)
+    agree = total = model_calls = 0
+    t_cascade = t_model = 0.0
+    scored = 0
+    for i, frame in enumerate(frames):
+        if i < calibrate_frames:
+            cascade.predict(frame)
+            if i == calibrate_frames - 1:
+                cascade.calibrate()
+            continue
+        started = time.perf_counter()
+        ref_labels, _ = baseline.predict(frame, learn=False)
+        t_model += time.perf_counter() - started
+
+        started = time.perf_counter()
+        labels, sources = cascade.predict(frame, learn=False)
+        t_cascade += time.perf_counter() - started
+
+        agree += int((labels == ref_labels).sum())
+        total += len(labels)
+        model_calls += int((sources == SOURCE_MODEL).sum())
+        scored += 1
+
+    if not scored:
+        print('Not enough frames: need more than', calibrate_frames)
+        return
+    print(f"Frames scored: {scored} (after {calibrate_frames} calibration frames)")
+    print(f"  Agreement with model-only: {agree / total * 100:.2f}%")
+    print(f"  Slots sent to model: {model_calls / total * 100:.1f}%")
+    print(f"  Model only: {t_model / scored * 1000:.1f} ms/frame")
+    print(f"  Cascade:    {t_cascade / scored * 1000:.1f} ms/frame")
+
+
+def main():
+    import pickle
+    from util import get_parking_spots_bboxes
+    from engine import MODEL_PATH, VIDEO_PATH, MASK_PATH
+
+    parser = argparse.ArgumentParser(description='Cascade accuracy-versus-speed report')
+    parser.add_argument('--frames', help="Glob of frame dumps, e.g. 'dumps/*.jpg'")
+    parser.add_argument('--video', default=VIDEO_PATH)
+    parser.add_argument('--mask', default=MASK_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--count', type=int, default=400, help='Maximum frames to use')
+    parser.add_argument('--calibrate', type=int, default=200, help='Frames used for calibration')
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as f:
+        model = pickle.load(f)
+    mask = cv2.imread(args.mask, 0)
+    if mask is None:
+        raise FileNotFoundError(f"Mask missing at: {args.mask}")
+    parking_spots = get_parking_spots_bboxes(mask)
+    report(model, parking_spots, iter_frames(args.frames, args.video, args.count), args.calibrate)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from engine import CSV_COLUMNS
+from retention import paths_between
+from row_index import load_index, byte_range, to_ms
+
+# Compact dtypes: slot counts fit in uint16, the percentage in float32.
+# frame_number restarts with every run of main.py; 32 bits covers a long one.
+DTYPES = {
+    'free_slots': np.uint16,
+    'occupied_slots': np.uint16,
+    'total_slots': np.uint16,
+    'occupancy_percent': np.float32,
+    'frame_number': np.uint32,
+    'timestamp': str,
+    # Only in compacted rollup segments: number of raw rows behind each row
+    'samples': np.uint32,
+}
+
+# main.py writes isoformat(timespec='milliseconds'); older rows used seconds only
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+LEGACY_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DEFAULT_CHUNKSIZE = 200_000
+
+# Minutes of data the live views (dashboard plots, live_dashboard.py) show by
+# default, ending at the newest row
+RECENT_MINUTES = 180
+
+
+def parse_timestamps(values):
+    """
+    Parse timestamps with fixed formats (no per-row format inference)
+    """
+    values = pd.Series(values)
+    parsed = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors='coerce')
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], format=LEGACY_TIMESTAMP_FORMAT, errors='coerce')
+    return parsed
+
+
+def _read_kwargs(csv_path, columns):
+    if columns is None:
+        columns = list(DTYPES)
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [c for c in columns if c in header]
+    dtype = {c: DTYPES[c] for c in usecols if c in DTYPES}
+    return {'usecols': usecols, 'dtype': dtype}
+
+
+def _finish(df):
+    if 'timestamp' in df.columns:
+        df['timestamp'] = parse_timestamps(df['timestamp'])
+    return df
+
+
+def _read(path, columns):
+    """A whole file, typed; None if it is gone (see _read_chunks)"""
+    try:
+        return _finish(pd.read_csv(path, **_read_kwargs(path, columns)))
+    except FileNotFoundError:
+        return None
+
+
+def parse_time(value):
+    """
+    A timestamp from an ISO string or datetime; strings like '-10min' mean that
+    long before now. None or '' stay None.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, str) and value.strip().startswith('-'):
+        return pd.Timestamp.now() - pd.Timedelta(value.strip()[1:])
+    # The CSV holds naive local times
+    return pd.Timestamp(value).tz_localize(None)
+
+
+def _paths(csv_path, history, start=None, end=None):
+    if history:
+        return paths_between(csv_path, start, end)
+    return [csv_path] if os.path.exists(csv_path) and os.path.getsize(csv_path) > 0 else []
+
+
+class _ByteWindow(io.RawIOBase):
+    """Bytes [start, stop) of a binary file as a readable stream"""
+
+    def __init__(self, f, start, stop):
+        self.f = f
+        self.f.seek(start)
+        self.remaining = stop - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.f.readinto(memoryview(b)[:min(len(b), self.remaining)])
+        self.remaining -= n or 0
+        return n
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def _indexed_window(path, start, end):
+    """
+    (stream, header) over the part of an indexed CSV that can hold rows between
+    start and end, found by seeking with its sparse index (see row_index.py);
+    None if the file has no usable index
+    """
+    if path.endswith('.gz'):
+        return None
+    entries = load_index(path)
+    if entries is None:
+        return None
+    first, last = byte_range(entries, to_ms(start) if start is not None else None,
+                             to_ms(end) if end is not None else None)
+    f = open(path, 'rb')
+    header = f.readline().decode().strip().split(',')
+    if last is None:
+        # Up to the last complete row; the writer may be mid-line
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(size - 4096, first))
+        tail = f.read()
+        last = size - len(tail) + tail.rfind(b'\n') + 1
+    return io.BufferedReader(_ByteWindow(f, first, max(last, first))), header
+
+
+def _read_chunks(path, columns, chunksize, start=None, end=None):
+    try:
+        kwargs = _read_kwargs(path, columns)
+        window = _indexed_window(path, start, end) if start is not None or end is not None else None
+        reader = pd.read_csv(path, chunksize=chunksize, **kwargs) if window is None else None
+    except FileNotFoundError:
+        # Compacted or rotated away since the paths were listed; an open file
+        # stays readable, and its rows are in the file that replaced it
+        return
+    if window is None:
+        with reader:
+            yield from reader
+        return
+    stream, header = window
+    with stream:
+        if stream.peek(1):
+            yield from pd.read_csv(stream, names=header, header=None, chunksize=chunksize, **kwargs)
+
+
+def _fill_samples(df):
+    # Raw rows stand for a single sample
+    if 'samples' in df.columns:
+        df['samples'] = df['samples'].fillna(1).astype(DTYPES['samples'])
+    return df
+
+
+def load_data(csv_path, columns=None, history=True, start=None, end=None):
+    """
+    Load the parking CSV with compact dtypes, reading only the requested columns.
+    With history=True, rotated/compacted segments (see retention.py) come first so
+    the result is one chronological history. Returns an empty DataFrame if there is no data.
+
+    start/end (see parse_time) keep only rows in that time window. Only the files
+    that can hold it are opened, and the live file is entered by seeking with its
+    row index, so a recent window costs the same however large the file grows.
+    """
+    if start is not None or end is not None:
+        frames = list(iter_chunks(csv_path, columns=columns, history=history, start=start, end=end))
+        if not frames:
+            return pd.DataFrame(columns=columns or CSV_COLUMNS)
+        return frames[0].reset_index(drop=True) if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    frames = [df for df in (_read(path, columns) for path in _paths(csv_path, history)) if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=columns or CSV_COLUMNS)
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return _fill_samples(df)
+
+
+def read_latest(csv_path, tail_bytes=4096):
+    """
+    Last row of the live CSV as a dict (None if there is none), reading only the
+    header and the final few KB rather than the whole file.
+    """
+    try:
+        with open(csv_path, 'rb') as f:
+            header = f.readline().decode().strip().split(',')
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(size - tail_bytes, 0))
+            tail = f.read().decode(errors='replace')
+    except FileNotFoundError:
+        # Between rotation and the fresh file
+        return None
+    # The writer may be mid-line; take the last complete row
+    lines = tail.split('\n')[:-1]
+    for line in reversed(lines):
+        values = line.strip().split(',')
+        if len(values) == len(header) and values != header:
+            break
+    else:
+        return None
+    row = {}
+    for name, value in zip(header, values):
+        if name == 'timestamp':
+            row[name] = parse_timestamps([value]).iloc[0]
+        elif name in DTYPES and value != '':
+            row[name] = float(value) if DTYPES[name] is np.float32 else int(value)
+        else:
+            row[name] = value
+    return row
+
+
+def recent_start(csv_path, minutes=RECENT_MINUTES):
+    """
+    Start of the `minutes` before the newest row of the live file, or before now
+    if it has no rows yet. As a start for load_data it keeps a view's read the
+    same size however long the history grows.
+    """
+    latest = read_latest(csv_path)
+    if latest is None or pd.isna(latest.get('timestamp')):
+        return pd.Timestamp.now() - pd.Timedelta(minutes=minutes)
+    return latest['timestamp'] - pd.Timedelta(minutes=minutes)
+
+
+def iter_chunks(csv_path, columns=None, chunksize=DEFAULT_CHUNKSIZE, history=True, start=None, end=None):
+    """
+    Yield typed DataFrame chunks of at most `chunksize` rows, oldest first,
+    optionally only rows with start <= timestamp <= end (see load_data)
+    """
+    start, end = parse_time(start), parse_time(end)
+    windowed = start is not None or end is not None
+    read_columns = columns
+    if windowed and columns is not None and 'timestamp' not in columns:
+        read_columns = list(columns) + ['timestamp']
+    for path in _paths(csv_path, history, start, end):
+        for chunk in _read_chunks(path, read_columns, chunksize, start, end):
+            chunk = _fill_samples(_finish(chunk))
+            if windowed:
+                keep = chunk['timestamp'].notna()
+                if start is not None:
+                    keep &= chunk['timestamp'] >= start
+                if end is not None:
+                    keep &= chunk['timestamp'] <= end
+                chunk = chunk[keep]
+                if read_columns is not columns:
+                    chunk = chunk.drop(columns='timestamp')
+                if chunk.empty:
+                    continue
+            yield chunk
+
+
+def aggregate_chunks(csv_path, by, column='occupancy_percent', chunksize=DEFAULT_CHUNKSIZE, start=None, end=None):
+    """
+    Streaming group-by aggregation of `column` in bounded memory.
+
+    by: a pandas frequency string (e.g. '5min', '1h') to bucket on the timestamp,
+        or a callable taking a chunk and returning the group keys for its rows
+        (a Series, or a list of Series for a multi-level key).
+
+    Each chunk is reduced to partial sum/count/min/max per key, so memory is bounded
+    by the chunk size plus the number of distinct keys, not the file size. Rollup
+    rows from compacted history are weighted by their `samples` count. start/end
+    restrict it to a time window, as in load_data.
+    Returns a DataFrame indexed by key with mean, min, max and count columns.
+    """
+    # A key function may need any column, so only narrow the read for frequency buckets
+    columns = None if callable(by) else [column, 'timestamp', 'samples']
+
+    partials = []
+    for chunk in iter_chunks(csv_path, columns=columns, chunksize=chunksize, start=start, end=end):
+        if callable(by):
+            keys = by(chunk)
+        else:
+            chunk = chunk.dropna(subset=['timestamp'])
+            keys = chunk['timestamp'].dt.floor(by)
+        values = chunk[column].astype(np.float64)
+        weights = chunk['samples'] if 'samples' in chunk.columns else pd.Series(1, index=chunk.index)
+        weights = weights.where(values.notna(), 0).astype(np.int64)
+        grouped = values.groupby(keys)
+        partials.append(pd.DataFrame({
+            'sum': (values * weights).groupby(keys).sum(),
+            'count': weights.groupby(keys).sum(),
+            'min': grouped.min(),
+            'max': grouped.max(),
+        }))
+
+    if not partials:
+        return pd.DataFrame(columns=['mean', 'min', 'max', 'count'])
+
+    # Buckets may straddle chunk boundaries, so combine the partials once more
+    partials = pd.concat(partials)
+    levels = list(range(partials.index.nlevels))
+    combined = partials.groupby(level=levels).agg({'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'})
+    combined['mean'] = combined['sum'] / combined['count'].where(combined['count'] > 0)
+    combined['count'] = combined['count'].astype(np.int64)
+    return combined[['mean', 'min', 'max', 'count']]
+
+
+def regroup(aggregated, keys):
+    """
+    Combine an aggregate_chunks() result into coarser groups without re-reading
+    the data, e.g. 5-minute buckets into hours of the day. keys are group keys
+    for its rows, as for DataFrame.groupby (a Series/Index, or a list of them).
+    """
+    if aggregated.empty:
+        return aggregated
+    count = aggregated['count']
+    parts = pd.DataFrame({
+        'sum': (aggregated['mean'] * count).fillna(0.0),
+        'count': count,
+        'min': aggregated['min'],
+        'max': aggregated['max'],
+    })
+    combined = parts.groupby(keys).agg({'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'})
+    combined['mean'] = combined['sum'] / combined['count'].where(combined['count'] > 0)
+    return combined[['mean', 'min', 'max', 'count']]
@@ -0,0 +1,304 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Default dataset locations (absolute, based on the project folder)
+PARKING_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset', 'archive (1)', 'parking'))
+MODEL_PATH = os.path.join(PARKING_DIR, 'model', 'model.p')
+VIDEO_PATH = os.path.join(PARKING_DIR, 'parking_1920_1080_loop.mp4')
+MASK_PATH = os.path.join(PARKING_DIR, 'mask_1920_1080.png')
+
+CSV_COLUMNS = ['free_slots', 'occupied_slots', 'total_slots', 'occupancy_percent', 'frame_number', 'timestamp']
+
+# Frame size assumed for pixel slot boxes given without one (the mask's size)
+DEFAULT_FRAME_SIZE = (1920, 1080)
+
+# Temporal smoothing: majority vote over the last HISTORY_SIZE predictions per slot
+HISTORY_SIZE = 5
+
+
+class ParkingMonitor:
+    """
+    Occupancy engine: loads the model and slot layout once, then turns frames into
+    per-slot occupancy (0 = free, 1 = occupied) with temporal smoothing.
+
+    Frames are classified in place (never copied), so read-only views from a
+    frame bus or a caller's own buffers can be passed straight in. Sinks get every
+    processed frame via sink.write(monitor, frame, occupancy) and are closed with
+    the monitor.
+
+    The slot layout is kept in normalized coordinates (see layout.py) and mapped
+    onto the actual frame size, remapping if a stream changes resolution. With
+    scale < 1 only the slots' bounding region is resized down and classified;
+    parking_spots stays in frame pixels either way.
+
+    Importing this module loads nothing; cv2, skimage and the model are only
+    pulled in when a monitor is created.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, mask_path=MASK_PATH, sinks=(), history_size=HISTORY_SIZE,
+                 calibration_path=None, model=None, parking_spots=None, layout=None, frame_size=None, scale=1.0):
+        import pickle
+        from layout import SlotLayout
+
+        if model is None:
+            with open(model_path, 'rb') as f:
+                model = pickle.load(f)
+        if layout is None:
+            if parking_spots is not None:
+                # Pixel boxes are taken to be drawn on frame_size frames
+                layout = SlotLayout.from_boxes(parking_spots, *(frame_size or DEFAULT_FRAME_SIZE))
+            else:
+                layout = mask_path
+        if isinstance(layout, str):
+            # Normalized JSON layout (see layout.py) or a mask image
+            layout = SlotLayout.load(layout)
+        self.model = model
+        self.layout = layout
+        self.total_slots = len(layout)
+        # Classify on the slots' bounding region resized by `scale` (1.0 = full frame)
+        self.scale = scale
+        self.calibration_path = calibration_path
+        self.history_size = history_size
+        self.frame_count = 0
+        # Frames dropped because `valid` failed (see process_frame)
+        self.dropped = 0
+        self.sinks = list(sinks)
+        self._configure(*(frame_size or layout.source_size or DEFAULT_FRAME_SIZE))
+
+    def _configure(self, width, height):
+        """Map the layout onto width x height frames and reset per-resolution state"""
+        from cascade import CascadeClassifier
+        from layout import ReducedView
+
+        self.frame_size = (width, height)
+        # Slot boxes in frame pixels, for drawing and for callers
+        self.parking_spots = self.layout.to_pixels(width, height)
+        self.view = ReducedView(self.layout, width, height, self.scale) if self.scale != 1.0 else None
+
+        self.cascade = CascadeClassifier(self.model, self.view.spots if self.view else self.parking_spots)
+        if self.calibration_path and os.path.exists(self.calibration_path):
+            self.cascade.load(self.calibration_path)
+
+        self.history = np.zeros((self.total_slots, self.history_size), dtype=np.uint8)
+        self.history_len = np.zeros(self.total_slots, dtype=np.int64)
+
+    def _working(self, frame):
+        """
+        The image the cascade sees for a frame, reconfiguring on a resolution change.
+        This may replace self.cascade, so call it before looking the cascade up.
+        """
+        height, width = frame.shape[:2]
+        if (width, height) != self.frame_size:
+            print(f"Frame size changed to {width}x{height}, remapping slot layout")
+            self._configure(width, height)
+        return self.view.extract(frame) if self.view is not None else frame
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def classify(self, frame, learn=True):
+        """Unsmoothed (labels, sources) for one frame; see cascade.CascadeClassifier"""
+        working = self._working(frame)
+        return self.cascade.predict(working, learn=learn)
+
+    def _smooth(self, labels, sources):
+        from cascade import SOURCE_GATE
+
+        # Slots too dark/bright to judge are marked occupied and not added to the history
+        judged = sources != SOURCE_GATE
+        slots = np.flatnonzero(judged)
+        self.history[slots, self.history_len[slots] % self.history_size] = labels[slots]
+        self.history_len[slots] += 1
+
+        occupancy = np.ones(self.total_slots, dtype=np.uint8)
+        warm = judged & (self.history_len >= self.history_size)
+        empty_votes = (self.history == 0).sum(axis=1)
+        occupancy[warm] = (empty_votes[warm] * 2 <= self.history_size).astype(np.uint8)
+        # During warmup, use the direct prediction
+        cold = judged & ~warm
+        occupancy[cold] = labels[cold]
+        return occupancy
+
+    def _emit(self, frame, occupancy):
+        self.frame_count += 1
+        for sink in self.sinks:
+            sink.write(self, frame, occupancy)
+
+    def process_frame(self, frame, valid=None):
+        """
+        Smoothed occupancy (uint8 per slot) for one frame. `valid`, if given, is
+        called once the frame has been classified; if it returns False (e.g. a frame
+        bus slot was overwritten meanwhile) the frame is dropped, nothing is learned
+        from it, and None is returned.
+        """
+        working = self._working(frame)
+        labels, sources = self.cascade.predict(working, valid=valid)
+        if labels is None:
+            self.dropped += 1
+            return None
+        occupancy = self._smooth(labels, sources)
+        self._emit(frame, occupancy)
+        return occupancy
+
+    def process_batch(self, frames):
+        """
+        Smoothed occupancy for a sequence of frames, shape (frames, slots). Ambiguous
+        slots from all frames share a single model call (one per run of frames of
+        the same size).
+        """
+        sizes = [frame.shape[:2] for frame in frames]
+        if len(set(sizes)) > 1:
+            cut = sizes.index(next(size for size in sizes if size != sizes[0]))
+            return np.concatenate([self.process_batch(frames[:cut]), self.process_batch(frames[cut:])])
+        working = [self._working(frame) for frame in frames]
+        labels, sources = self.cascade.predict_batch(working)
+        out = np.empty((len(labels), self.total_slots), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            out[i] = self._smooth(labels[i], sources[i])
+            self._emit(frame, out[i])
+        return out
+
+    def counts(self, occupancy):
+        """(free, occupied, occupancy percent) for an occupancy array"""
+        occupied = int(occupancy.sum())
+        free = self.total_slots - occupied
+        percent = (occupied / self.total_slots * 100) if self.total_slots > 0 else 0
+        return free, occupied, percent
+
+    def close(self):
+        if self.calibration_path:
+            try:
+                self.cascade.save(self.calibration_path)
+            except Exception as e:
+                print("Could not save cascade calibration:", e)
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print("Error closing sink:", e)
+
+
+class CsvSink:
+    """Per-frame summary rows to parking_data.csv (rotated/compacted, see retention.py)"""
+
+    def __init__(self, csv_path, **writer_kwargs):
+        from retention import RotatingCsvWriter, compact_in_background
+
+        writer_kwargs.setdefault('on_rotate', compact_in_background)
+        self.writer = RotatingCsvWriter(csv_path, CSV_COLUMNS, **writer_kwargs)
+
+    def write(self, monitor, frame, occupancy):
+        free, occupied, percent = monitor.counts(occupancy)
+        # ISO timestamp with milliseconds
+        timestamp = datetime.now().isoformat(timespec='milliseconds')
+        self.writer.writerow([free, occupied, monitor.total_slots, f"{percent:.1f}", monitor.frame_count, timestamp])
+
+    def close(self):
+        self.writer.close()
+
+
+class BinaryStoreSink:
+    """
+    Dense per-slot occupancy store: a small header, then one fixed-size record per
+    frame (int64 milliseconds since epoch + one uint8 per slot). Read it back with
+    load_binary_store().
+    """
+
+    MAGIC = 0x50524B4F  # 'PRKO'
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def write(self, monitor, frame, occupancy):
+        if self.file is None:
+            exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+            if exists:
+                magic, slots = np.fromfile(self.path, dtype='<i8', count=2)
+                if magic != self.MAGIC or slots != monitor.total_slots:
+                    raise ValueError(f"{self.path} was written for a different slot layout")
+            self.file = open(self.path, 'ab')
+            if not exists:
+                np.array([self.MAGIC, monitor.total_slots], dtype='<i8').tofile(self.file)
+        record = np.zeros(1, dtype=record_dtype(monitor.total_slots))
+        record['t'] = int(datetime.now().timestamp() * 1000)
+        record['occupancy'] = occupancy
+        record.tofile(self.file)
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def record_dtype(slots):
+    return np.dtype([('t', '<i8'), ('occupancy', 'u1', (slots,))])
+
+
+def load_binary_store(path, mmap=True):
+    """
+    Returns (timestamps_ms int64[frames], occupancy uint8[frames, slots]) from a
+    BinaryStoreSink file; memory-mapped by default.
+    """
+    magic, slots = np.fromfile(path, dtype='<i8', count=2)
+    if magic != BinaryStoreSink.MAGIC:
+        raise ValueError(f"{path} is not a slot occupancy store")
+    dtype = record_dtype(int(slots))
+    frames = (os.path.getsize(path) - 16) // dtype.itemsize
+    if mmap:
+        records = np.memmap(path, dtype=dtype, mode='r', offset=16, shape=(frames,))
+    else:
+        records = np.fromfile(path, dtype=dtype, offset=16, count=frames)
+    return records['t'], records['occupancy']
+
+
+class OverlaySink:
+    """
+    Draws the slot outlines and status text onto each frame (see overlay.py).
+
+    Writeable frames are drawn on in place; read-only ones (frame bus views) are
+    first copied into a reused display buffer. `frame` is the last annotated
+    frame. If `active` is given and returns False, nobody is watching and the
+    frame is neither copied nor drawn (`frame` is then None).
+    """
+
+    def __init__(self, active=None):
+        self.active = active
+        self.overlay = None
+        self.spots = None
+        self.buffer = None
+        self.frame = None
+
+    def write(self, monitor, frame, occupancy):
+        if self.active is not None and not self.active():
+            self.frame = None
+            return
+        if not frame.flags.writeable:
+            if self.buffer is None or self.buffer.shape != frame.shape:
+                self.buffer = np.empty_like(frame)
+            np.copyto(self.buffer, frame)
+            frame = self.buffer
+        # Rebuilt if the monitor remapped its layout to a new frame size
+        if self.overlay is None or self.spots is not monitor.parking_spots:
+            from overlay import SlotOverlay
+
+            self.spots = monitor.parking_spots
+            self.overlay = SlotOverlay(monitor.parking_spots, frame.shape)
+            self.overlay.add_text((50, 50), 1, (255, 255, 255), 2)
+            self.overlay.add_text((50, 90), 1, (255, 255, 255), 2)
+            self.overlay.add_text((50, 130), 0.7, (200, 200, 200), 1)
+        free, occupied, percent = monitor.counts(occupancy)
+        self.overlay.update(occupancy, [
+            f'Free slots: {free} | Total: {monitor.total_slots}',
+            f'Occupied: {occupied} | Occupancy: {percent:.1f}%',
+            f'Frame: {monitor.frame_count}',
+        ])
+        self.overlay.composite(frame)
+        self.frame = frame
+
+    def close(self):
+        pass
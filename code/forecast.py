@@ -0,0 +1,459 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from data_loader import iter_chunks, load_data
+
+# Trained profile kept next to parking_data.csv (see train/refresh below)
+FORECAST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forecast_profile.npz')
+
+# Width of a time-of-day bin; 15 minutes gives a 7 x 96 table
+BIN_MINUTES = 15
+# Older weeks fade out with this half-life, so the profile follows slow changes
+HALFLIFE_DAYS = 28
+# The current deviation from the profile decays back to it with a time constant
+# learned from how the deviations persist over TREND_LAG_MINUTES in the training
+# data; TREND_MINUTES until there is enough data to tell
+TREND_MINUTES = 60
+TREND_LAG_MINUTES = 60
+TREND_LIMITS = (5, 720)
+# Occupancy over this much recent data is taken as the current level
+LEVEL_MINUTES = 5
+
+MINUTE_NS = 60 * 10**9
+DAY_NS = 1440 * MINUTE_NS
+WEEK_NS = 7 * DAY_NS
+MINUTES_PER_WEEK = 7 * 1440
+
+
+def _ns(times):
+    return np.asarray(times, dtype='datetime64[ns]').view(np.int64)
+
+
+def minute_of_week(times):
+    """Minutes since Monday 00:00 (the epoch was a Thursday)"""
+    return ((_ns(times) + 3 * DAY_NS) % WEEK_NS) / MINUTE_NS
+
+
+class SeasonalForecaster:
+    """
+    Occupancy forecaster: a day-of-week by time-of-day profile of occupancy %
+    plus the current deviation from it, decaying back to the profile.
+
+    The profile is a table of weighted sums and weights per bin, so it is updated
+    incrementally with new rows (update/refresh) and answering a forecast is a
+    table lookup, independent of how much history it was trained on.
+
+    Every row is weighted by its age relative to the newest row, and deviations
+    for the persistence estimate are taken per completed minute against the
+    profile as it stood when that day began, so the result does not depend on
+    how the rows were split into update() calls.
+    """
+
+    def __init__(self, bin_minutes=BIN_MINUTES, halflife_days=HALFLIFE_DAYS):
+        if 1440 % bin_minutes:
+            raise ValueError("bin_minutes must divide a day")
+        self.bin_minutes = bin_minutes
+        self.halflife_days = halflife_days
+        self.bins = MINUTES_PER_WEEK // bin_minutes
+        self.sum = np.zeros(self.bins)
+        self.weight = np.zeros(self.bins)
+        # Lag-TREND_LAG_MINUTES co-moments of the per-minute deviations (xy, xx, yy, pairs)
+        self.persistence = np.zeros(4)
+        self.trained_until = None
+        self.level = np.nan
+        self.level_time = None
+        self._profile = None
+        # Profile at the start of the current day (nan before any data), its day number
+        self.base = np.full(self.bins, np.nan)
+        self.base_day = -1
+        # Per-minute sums of the newest minutes, ending with the still open one
+        self.tail_start = -1
+        self.tail_sum = np.zeros(0)
+        self.tail_weight = np.zeros(0)
+        # Deviations of the TREND_LAG_MINUTES minutes before final_end, the first
+        # minute not yet complete
+        self.final_end = -1
+        self.deviations = np.full(TREND_LAG_MINUTES, np.nan)
+
+    @property
+    def trained(self):
+        return bool(self.weight.any())
+
+    def _decay(self, age_ns):
+        if not self.halflife_days:
+            return np.ones_like(np.asarray(age_ns, dtype=np.float64))
+        return 0.5 ** (np.asarray(age_ns, dtype=np.float64) / (self.halflife_days * DAY_NS))
+
+    def update(self, timestamps, values, weights=None):
+        """
+        Add rows newer than trained_until. `weights` (e.g. the rollup `samples`
+        column) count a row as that many raw rows. Returns the number of rows used.
+        """
+        ns = _ns(pd.to_datetime(pd.Series(timestamps).reset_index(drop=True)))
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+        ok = (ns != np.iinfo(np.int64).min) & np.isfinite(values) & (weights > 0)
+        if self.trained_until is not None:
+            ok &= ns > self.trained_until.value
+        if not ok.any():
+            return 0
+        order = np.argsort(ns[ok], kind='stable')
+        ns, values, weights = ns[ok][order], values[ok][order], weights[ok][order]
+        newest = int(ns[-1])
+
+        if self.trained_until is not None:
+            decay = float(self._decay(newest - self.trained_until.value))
+            self.sum *= decay
+            self.weight *= decay
+            self.persistence[:3] *= decay
+        days = ns // DAY_NS
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(days)) + 1, [len(ns)]])
+        for lo, hi in zip(starts[:-1], starts[1:]):
+            self._add_day(ns[lo:hi], values[lo:hi], weights[lo:hi], newest)
+        self.trained_until = pd.Timestamp(newest)
+
+        # The current level: occupancy over the newest LEVEL_MINUTES (and the open minute)
+        self.level = float(self.tail_sum.sum() / self.tail_weight.sum())
+        self.level_time = pd.Timestamp(newest)
+        return int(ok.sum())
+
+    def _add_day(self, ns, values, weights, newest):
+        """Rows of one day, in time order, all newer than what was added before"""
+        day = int(ns[0] // DAY_NS)
+        minute = ns // MINUTE_NS
+        first, last = int(minute[0]), int(minute[-1])
+        if self.final_end < 0:
+            self.final_end = first
+        # The minute left open by earlier rows is complete once a later one starts
+        self._finalize(first, newest)
+        if day != self.base_day:
+            self.base = self.profile.copy()
+            self.base_day = day
+
+        span = last - first + 1
+        msum = np.bincount(minute - first, weights=values * weights, minlength=span)
+        mweight = np.bincount(minute - first, weights=weights, minlength=span)
+        if self.tail_start < 0 or first - (self.tail_start + len(self.tail_sum)) > LEVEL_MINUTES:
+            # Nothing recent enough to keep
+            self.tail_start, self.tail_sum, self.tail_weight = first, msum, mweight
+        elif first >= self.tail_start + len(self.tail_sum):
+            gap = np.zeros(first - (self.tail_start + len(self.tail_sum)))
+            self.tail_sum = np.concatenate([self.tail_sum, gap, msum])
+            self.tail_weight = np.concatenate([self.tail_weight, gap, mweight])
+        else:
+            # Continues the open minute
+            self.tail_sum = np.concatenate([self.tail_sum[:-1], self.tail_sum[-1:] + msum[:1], msum[1:]])
+            self.tail_weight = np.concatenate([self.tail_weight[:-1], self.tail_weight[-1:] + mweight[:1], mweight[1:]])
+        self._finalize(last, newest)
+        # Once complete, only the minutes the level is taken over are needed
+        excess = len(self.tail_sum) - (LEVEL_MINUTES + 1)
+        if excess > 0:
+            self.tail_start += excess
+            self.tail_sum, self.tail_weight = self.tail_sum[excess:], self.tail_weight[excess:]
+
+        cells = (minute_of_week(ns.view('datetime64[ns]')) // self.bin_minutes).astype(np.int64)
+        w = weights * self._decay(newest - ns)
+        self.sum += np.bincount(cells, weights=values * w, minlength=self.bins)
+        self.weight += np.bincount(cells, weights=w, minlength=self.bins)
+        self._profile = None
+
+    def _finalize(self, until, newest):
+        """Take the deviations of the complete minutes before `until` into the persistence sums"""
+        if until <= self.final_end:
+            return
+        lo = self.final_end - self.tail_start
+        hi = min(until, self.tail_start + len(self.tail_sum)) - self.tail_start
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.tail_sum[max(lo, 0):max(hi, 0)] / self.tail_weight[max(lo, 0):max(hi, 0)]
+        minutes = self.final_end + np.arange(len(mean))
+        deviation = mean - self._expected(minutes * MINUTE_NS, self.base)
+        # Minutes without data; beyond TREND_LAG_MINUTES they cannot pair with anything
+        missing = until - self.final_end - len(deviation)
+        deviation = np.concatenate([deviation, np.full(min(missing, TREND_LAG_MINUTES), np.nan)])
+        minutes = self.final_end + np.arange(len(deviation))
+
+        series = np.concatenate([self.deviations, deviation])
+        x, y = series[:-TREND_LAG_MINUTES], series[TREND_LAG_MINUTES:]
+        both = np.isfinite(x) & np.isfinite(y)
+        w = self._decay(newest - minutes[both] * MINUTE_NS)
+        x, y = x[both], y[both]
+        self.persistence += [np.sum(w * x * y), np.sum(w * x * x), np.sum(w * y * y), len(x)]
+        self.deviations = series[-TREND_LAG_MINUTES:]
+        self.final_end = until
+
+    @property
+    def trend_minutes(self):
+        """Time constant of the deviation's decay, from its lag autocorrelation"""
+        xy, xx, yy, pairs = self.persistence
+        if pairs < 2 * TREND_LAG_MINUTES or xx <= 0 or yy <= 0:
+            return TREND_MINUTES
+        rho = xy / np.sqrt(xx * yy)
+        if rho <= 0:
+            return TREND_LIMITS[0]
+        if rho >= 1:
+            return TREND_LIMITS[1]
+        return float(np.clip(-TREND_LAG_MINUTES / np.log(rho), *TREND_LIMITS))
+
+    def update_frame(self, df):
+        """update() from a parking_data DataFrame (timestamp, occupancy_percent[, samples])"""
+        weights = df['samples'] if 'samples' in df.columns else None
+        return self.update(df['timestamp'], df['occupancy_percent'], weights)
+
+    def fit(self, csv_path):
+        """Train on the whole history of csv_path (rollups and live file), in chunks"""
+        used = 0
+        for chunk in iter_chunks(csv_path, columns=['occupancy_percent', 'timestamp', 'samples']):
+            used += self.update_frame(chunk)
+        return used
+
+    def refresh(self, csv_path):
+        """
+        Absorb rows written since the last update. Only the files that can hold
+        them are read, and the live file is entered by seeking with its row index.
+        """
+        if self.trained_until is None:
+            return self.fit(csv_path)
+        used = 0
+        for chunk in iter_chunks(csv_path, columns=['occupancy_percent', 'timestamp', 'samples'],
+                                 start=self.trained_until):
+            used += self.update_frame(chunk)
+        return used
+
+    @property
+    def profile(self):
+        """
+        Mean occupancy per bin. Bins never seen fall back to the same time of day
+        on other days, then to the overall mean.
+        """
+        if self._profile is None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                profile = self.sum / self.weight
+                per_day = self.sum.reshape(7, -1).sum(axis=0) / self.weight.reshape(7, -1).sum(axis=0)
+                overall = self.sum.sum() / self.weight.sum()
+            profile = profile.reshape(7, -1)
+            profile = np.where(np.isnan(profile), per_day[None, :], profile).ravel()
+            self._profile = np.where(np.isnan(profile), overall, profile)
+        return self._profile
+
+    def expected(self, times):
+        """Profile value at each time, interpolated between bin centres"""
+        return self._expected(times, self.profile)
+
+    def _expected(self, times, profile):
+        pos = minute_of_week(times) / self.bin_minutes - 0.5
+        lo = np.floor(pos)
+        frac = pos - lo
+        lo = lo.astype(np.int64) % self.bins
+        hi = (lo + 1) % self.bins
+        return profile[lo] + (profile[hi] - profile[lo]) * frac
+
+    def forecast_values(self, minutes=60, step_minutes=5, start=None, level=None):
+        """
+        (times as datetime64[ns], expected occupancy %) every step_minutes over the
+        next `minutes`. `start` defaults to the newest trained row and `level` to
+        the occupancy seen just before it.
+        """
+        if start is None:
+            start = self.trained_until if self.trained_until is not None else pd.Timestamp.now()
+        start = pd.Timestamp(start).value
+        steps = max(1, int(np.ceil(minutes / step_minutes)))
+        times = (start + np.arange(1, steps + 1, dtype=np.int64) * int(step_minutes * MINUTE_NS)).view('datetime64[ns]')
+        values = self.expected(times)
+        trend = self.trend_minutes
+        observed = start
+        if level is None and self.level_time is not None and 0 <= start - self.level_time.value <= 3 * trend * MINUTE_NS:
+            level, observed = self.level, self.level_time.value
+        if level is not None and np.isfinite(level):
+            # The deviation decays from when it was observed
+            residual = level - self.expected(np.array([observed]).view('datetime64[ns]'))[0]
+            age = (times.view(np.int64) - observed) / MINUTE_NS
+            values = values + residual * np.exp(-age / trend)
+        return times, np.clip(values, 0.0, 100.0)
+
+    def forecast(self, minutes=60, step_minutes=5, start=None, level=None):
+        """forecast_values() as a Series indexed by time"""
+        times, values = self.forecast_values(minutes, step_minutes, start, level)
+        return pd.Series(values, index=pd.DatetimeIndex(times), name='occupancy_percent')
+
+    def save(self, path):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, sum=self.sum, weight=self.weight, persistence=self.persistence, bin_minutes=self.bin_minutes,
+                 halflife_days=self.halflife_days,
+                 trained_until=self.trained_until.value if self.trained_until is not None else -1,
+                 level=self.level, level_time=self.level_time.value if self.level_time is not None else -1,
+                 base=self.base, base_day=self.base_day, tail_start=self.tail_start, tail_sum=self.tail_sum,
+                 tail_weight=self.tail_weight, final_end=self.final_end, deviations=self.deviations)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        forecaster = cls(int(data['bin_minutes']), float(data['halflife_days']))
+        forecaster.sum, forecaster.weight = data['sum'], data['weight']
+        forecaster.persistence = data['persistence']
+        if int(data['trained_until']) >= 0:
+            forecaster.trained_until = pd.Timestamp(int(data['trained_until']))
+        if int(data['level_time']) >= 0:
+            forecaster.level = float(data['level'])
+            forecaster.level_time = pd.Timestamp(int(data['level_time']))
+        if 'deviations' in data:
+            forecaster.base, forecaster.base_day = data['base'], int(data['base_day'])
+            forecaster.tail_start, forecaster.final_end = int(data['tail_start']), int(data['final_end'])
+            forecaster.tail_sum, forecaster.tail_weight = data['tail_sum'], data['tail_weight']
+            forecaster.deviations = data['deviations']
+        return forecaster
+
+    @classmethod
+    def load_or_new(cls, path=FORECAST_PATH):
+        if os.path.exists(path):
+            try:
+                return cls.load(path)
+            except Exception as e:
+                print(f"Could not load forecast profile {path}: {e}")
+        return cls()
+
+
+def forecast_after(df, forecaster=None, minutes=60, step_minutes=1):
+    """
+    Forecast for the `minutes` after the last row of a parking_data DataFrame, for
+    plotting. Uses the saved profile (kept current by web_dashboard.py or
+    `forecast.py train`), absorbing any newer rows of df; None without timestamps.
+    """
+    if df.empty or 'timestamp' not in df.columns or df['timestamp'].isna().all():
+        return None
+    if forecaster is None:
+        forecaster = SeasonalForecaster.load_or_new()
+    forecaster.update_frame(df)
+    return forecaster.forecast(minutes, step_minutes, start=df['timestamp'].max())
+
+
+def linear_forecast(times, values, horizon_minutes, n_fit=200):
+    """The previous forecast: a straight line through the last n_fit rows, extrapolated in time"""
+    t = (pd.DatetimeIndex(times[-n_fit:]) - times[-1]) / pd.Timedelta(minutes=1)
+    coeffs = np.polyfit(np.asarray(t, dtype=np.float64), values[-n_fit:], 1)
+    return np.clip(np.polyval(coeffs, np.asarray(horizon_minutes, dtype=np.float64)), 0.0, 100.0)
+
+
+def synthetic_history(days=56, seed=0):
+    """Per-minute occupancy with weekday/weekend daily shapes, slow drift and noise"""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2026-01-05', periods=days * 1440, freq='1min')
+    hour = times.hour + times.minute / 60.0
+    weekday = times.dayofweek < 5
+    shape = np.where(weekday,
+                     20 + 65 * np.exp(-((hour - 10.5) / 2.5) ** 2) + 45 * np.exp(-((hour - 15.5) / 2.0) ** 2),
+                     15 + 40 * np.exp(-((hour - 13.0) / 3.5) ** 2))
+    # Day-level shocks that persist for hours (weather, events), plus frame noise
+    shock = np.repeat(rng.normal(0, 6, days * 6), 240)
+    drift = np.cumsum(rng.normal(0, 0.05, len(times)))
+    values = np.clip(shape + shock + drift - drift.mean() + rng.normal(0, 3, len(times)), 0, 100)
+    return pd.DataFrame({'timestamp': times, 'occupancy_percent': values})
+
+
+def backtest(df, train_fraction=0.5, horizons=(15, 30, 60), every_minutes=60, queries=2000):
+    """
+    Rolling-origin backtest: train on the first train_fraction of the history, then
+    at every origin in the rest forecast each horizon, score it against the actual
+    1-minute mean, and absorb the data up to the next origin incrementally.
+    Prints MAE per horizon for the seasonal forecaster, the old linear fit and
+    persistence (last value), and per-query latency.
+    """
+    df = df.dropna(subset=['timestamp', 'occupancy_percent']).sort_values('timestamp')
+    minute = df.set_index('timestamp')['occupancy_percent'].astype(np.float64).resample('1min').mean()
+    if len(minute) < 2:
+        print('Not enough data for a backtest')
+        return
+    split = minute.index[0] + (minute.index[-1] - minute.index[0]) * train_fraction
+    forecaster = SeasonalForecaster()
+    forecaster.update_frame(df[df['timestamp'] <= split])
+
+    origins = pd.date_range(split.ceil(f'{every_minutes}min'), minute.index[-1] - pd.Timedelta(minutes=max(horizons)),
+                            freq=f'{every_minutes}min')
+    times = df['timestamp'].to_numpy()
+    values = df['occupancy_percent'].to_numpy(dtype=np.float64)
+    errors = {name: {h: [] for h in horizons} for name in ('seasonal', 'linear', 'persistence')}
+    last = split
+    for origin in origins:
+        forecaster.update_frame(df[(df['timestamp'] > last) & (df['timestamp'] <= origin)])
+        last = origin
+        end = np.searchsorted(times, origin.to_datetime64(), side='right')
+        if end < 2:
+            continue
+        seasonal = forecaster.forecast(max(horizons), step_minutes=1, start=origin)
+        linear = linear_forecast(times[:end], values[:end], horizons)
+        for i, h in enumerate(horizons):
+            actual = minute.get(origin + pd.Timedelta(minutes=h))
+            if actual is None or np.isnan(actual):
+                continue
+            errors['seasonal'][h].append(abs(seasonal.iloc[h - 1] - actual))
+            errors['linear'][h].append(abs(linear[i] - actual))
+            errors['persistence'][h].append(abs(values[end - 1] - actual))
+
+    scored = max(len(e) for e in errors['seasonal'].values())
+    print(f"Backtest: trained on {minute.index[0]} .. {split}, {scored} origins every {every_minutes} min")
+    print(f"  Learned deviation time constant: {forecaster.trend_minutes:.0f} min")
+    print(f"  {'MAE (pp)':<12}" + ''.join(f"{f'{h} min':>10}" for h in horizons))
+    for name, by_h in errors.items():
+        print(f"  {name:<12}" + ''.join(f"{np.mean(e) if e else np.nan:10.2f}" for e in by_h.values()))
+
+    # Query latency: the seasonal lookup against the linear fit it replaces
+    latencies = {'seasonal': [], 'linear': []}
+    rng = np.random.default_rng(0)
+    for _ in range(queries):
+        end = int(rng.integers(200, len(times))) if len(times) > 200 else len(times)
+        started = time.perf_counter()
+        forecaster.forecast_values(60, step_minutes=5)
+        latencies['seasonal'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        linear_forecast(times[:end], values[:end], np.arange(5, 65, 5))
+        latencies['linear'].append(time.perf_counter() - started)
+    for name, lat in latencies.items():
+        lat = np.array(lat) * 1e6
+        print(f"  {name} query: p50 {np.percentile(lat, 50):.0f} us, p99 {np.percentile(lat, 99):.0f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seasonal occupancy forecaster')
+    sub = parser.add_subparsers(dest='command', required=True)
+    csv_default = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parking_data.csv')
+
+    train = sub.add_parser('train', help='Train (or incrementally refresh) the saved profile')
+    train.add_argument('--csv', default=csv_default)
+    train.add_argument('--output', default=FORECAST_PATH)
+    train.add_argument('--full', action='store_true', help='Retrain from scratch instead of refreshing')
+
+    query = sub.add_parser('query', help='Print the forecast from the saved profile')
+    query.add_argument('--profile', default=FORECAST_PATH)
+    query.add_argument('--minutes', type=int, default=60)
+    query.add_argument('--step', type=int, default=5)
+
+    bt = sub.add_parser('backtest', help='Error and latency of the forecaster on history')
+    bt.add_argument('--csv', default=csv_default)
+    bt.add_argument('--synthetic', type=int, metavar='DAYS', help='Use synthetic per-minute data instead')
+    bt.add_argument('--train-fraction', type=float, default=0.5)
+    bt.add_argument('--every', type=int, default=60, help='Minutes between forecast origins')
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        forecaster = SeasonalForecaster() if args.full else SeasonalForecaster.load_or_new(args.output)
+        used = forecaster.refresh(args.csv)
+        forecaster.save(args.output)
+        print(f"Absorbed {used} rows, trained until {forecaster.trained_until}; saved {args.output}")
+    elif args.command == 'query':
+        forecaster = SeasonalForecaster.load(args.profile)
+        print(forecaster.forecast(args.minutes, args.step).round(1).to_string())
+    else:
+        if args.synthetic:
+            df = synthetic_history(args.synthetic)
+        else:
+            df = load_data(args.csv, columns=['occupancy_percent', 'timestamp'])
+        backtest(df, args.train_fraction, every_minutes=args.every)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+import sys
+import time
+import argparse
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shared memory layout:
+#   header  int64[HEADER_LEN]       magic, slot count, frame shape, last committed sequence,
+#                                   last reader heartbeat (ms since epoch)
+#   seqs    int64[slots]            sequence number held by each slot (-1 while being written)
+#   frames  uint8[slots, h, w, c]   preallocated frame slots
+MAGIC = 0x50524B42  # 'PRKB'
+HEADER_LEN = 8
+H_MAGIC, H_SLOTS, H_HEIGHT, H_WIDTH, H_CHANNELS, H_WRITE_SEQ, H_HEARTBEAT = range(7)
+
+DEFAULT_SHAPE = (1080, 1920, 3)
+DEFAULT_SLOTS = 4
+WRITING = -1
+
+
+def _frames_offset(slots):
+    # Keep frame data 64-byte aligned
+    offset = (HEADER_LEN + slots) * 8
+    return (offset + 63) // 64 * 64
+
+
+def _attach_untracked(name):
+    """
+    Attach to an existing segment without letting this process's resource
+    tracker unlink it on exit (only the creator owns the segment).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    # Older versions always register with the tracker; suppress it for this call
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class FrameBus:
+    """
+    Ring of preallocated frame slots in shared memory.
+
+    One process (the decoder) creates the bus and publishes frames; any number
+    of consumer processes attach by name and read zero-copy views through a
+    FrameReader. A slot is only overwritten after `slots - 1` newer frames have
+    been published, and readers can check whether a view is still intact.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        if self.header[H_MAGIC] != MAGIC:
+            raise ValueError(f"Shared memory '{shm.name}' is not a frame bus")
+        self.slots = int(self.header[H_SLOTS])
+        self.shape = (int(self.header[H_HEIGHT]), int(self.header[H_WIDTH]), int(self.header[H_CHANNELS]))
+        self.seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=HEADER_LEN * 8)
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=shm.buf,
+                                 offset=_frames_offset(self.slots))
+        self._pending = None
+
+    @classmethod
+    def create(cls, name=None, slots=DEFAULT_SLOTS, shape=DEFAULT_SHAPE):
+        if slots < 2:
+            raise ValueError("A frame bus needs at least 2 slots")
+        size = _frames_offset(slots) + slots * int(np.prod(shape))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[H_SLOTS] = slots
+        header[H_HEIGHT], header[H_WIDTH], header[H_CHANNELS] = shape
+        np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=HEADER_LEN * 8)[:] = 0
+        header[H_MAGIC] = MAGIC
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_untracked(name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        """Sequence number of the most recently published frame (0 = none yet)"""
+        return int(self.header[H_WRITE_SEQ])
+
+    def slot_of(self, seq):
+        return (seq - 1) % self.slots
+
+    def touch(self):
+        """Record that a reader is active (see has_readers)"""
+        self.header[H_HEARTBEAT] = int(time.time() * 1000)
+
+    def has_readers(self, within=2.0):
+        """
+        True if a reader touched the bus in the last `within` seconds. Writers of
+        optional streams can skip publishing entirely while nobody is reading.
+        """
+        return time.time() * 1000 - self.header[H_HEARTBEAT] <= within * 1000
+
+    # ---- writer side ----
+
+    def acquire(self):
+        """
+        Return the next slot as a writable array so the decoder can fill it in
+        place (e.g. video.read(bus.acquire())). Call commit() to publish it.
+        Calling acquire() again without commit() returns the same slot.
+        """
+        if self._pending is None:
+            seq = self.write_seq + 1
+            slot = self.slot_of(seq)
+            self.seqs[slot] = WRITING
+            self._pending = seq
+        return self.frames[self.slot_of(self._pending)]
+
+    def commit(self):
+        seq = self._pending
+        if seq is None:
+            raise RuntimeError("commit() without acquire()")
+        self.seqs[self.slot_of(seq)] = seq
+        self.header[H_WRITE_SEQ] = seq
+        self._pending = None
+        return seq
+
+    def publish(self, frame):
+        """Copy a frame into the next slot and publish it"""
+        np.copyto(self.acquire(), frame)
+        return self.commit()
+
+    def close(self):
+        # Drop our views before closing the mapping
+        self.header = self.seqs = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class FrameReader:
+    """
+    Consumer-side cursor over a FrameBus.
+
+    policy='latest'      always jump to the newest frame; slow readers skip frames.
+    policy='sequential'  return every frame in order; a reader that falls more than
+                         a ring behind skips ahead to the oldest frame still held,
+                         and the skipped frames are counted in `dropped`.
+
+    Views returned by read() are read-only and zero-copy. They stay valid until the
+    writer wraps around to that slot; call is_valid(seq) after using a view to
+    check it was not overwritten meanwhile (and discard the result if it was).
+    """
+
+    def __init__(self, bus, policy='latest'):
+        if policy not in ('latest', 'sequential'):
+            raise ValueError(f"Unknown policy: {policy}")
+        self.bus = bus
+        self.policy = policy
+        self.last_seq = 0
+        self.dropped = 0
+
+    def _next_seq(self):
+        head = self.bus.write_seq
+        if head <= self.last_seq:
+            return None
+        if self.policy == 'latest':
+            self.dropped += head - self.last_seq - 1
+            return head
+        seq = self.last_seq + 1
+        # The writer may be filling the oldest slot, so keep one slot of margin
+        oldest = head - self.bus.slots + 2
+        if seq < oldest:
+            self.dropped += oldest - seq
+            seq = oldest
+        return seq
+
+    def read(self, timeout=None, poll_interval=0.001):
+        """
+        Return (seq, frame_view) for the next frame according to the policy, waiting
+        up to `timeout` seconds (forever if None). Returns (None, None) on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            seq = self._next_seq()
+            if seq is not None and self.bus.seqs[self.bus.slot_of(seq)] == seq:
+                self.last_seq = seq
+                view = self.bus.frames[self.bus.slot_of(seq)]
+                view.flags.writeable = False
+                return seq, view
+            if deadline is not None and time.monotonic() >= deadline:
+                return None, None
+            time.sleep(poll_interval)
+
+    def is_valid(self, seq):
+        return bool(self.bus.seqs[self.bus.slot_of(seq)] == seq)
+
+
+def run_decoder(video_path, name, slots=DEFAULT_SLOTS, fps=None):
+    """
+    Decode a video (looping) straight into the bus slots: one decode and no extra
+    copy per frame, however many consumers are attached.
+    """
+    import cv2
+
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        raise FileNotFoundError(f"Video missing at: {video_path}")
+    shape = (int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+    fps = fps or video.get(cv2.CAP_PROP_FPS) or 25
+    bus = FrameBus.create(name=name, slots=slots, shape=shape)
+    print(f"Frame bus '{bus.name}' ready: {slots} slots of {shape[1]}x{shape[0]}")
+    try:
+        while True:
+            started = time.monotonic()
+            ret, _ = video.read(bus.acquire())
+            if not ret:
+                video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            bus.commit()
+            time.sleep(max(0.0, 1.0 / fps - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        video.release()
+        bus.close()
+
+
+def run_snapshot(name, out_path):
+    import cv2
+
+    bus = FrameBus.attach(name)
+    try:
+        reader = FrameReader(bus)
+        seq, frame = reader.read(timeout=5.0)
+        if seq is None:
+            print("No frame published within 5s")
+            return
+        ok = cv2.imwrite(out_path, frame)
+        if ok and reader.is_valid(seq):
+            print(f"Saved frame {seq} to {out_path}")
+        else:
+            print("Frame was overwritten while saving, try again")
+    finally:
+        bus.close()
+
+
+def run_recorder(name, out_path, fps=25):
+    import cv2
+
+    bus = FrameBus.attach(name)
+    reader = FrameReader(bus, policy='sequential')
+    h, w, _ = bus.shape
+    writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+    print(f"Recording '{name}' to {out_path} (Ctrl+C to stop)")
+    try:
+        while True:
+            seq, frame = reader.read()
+            # Copy first: the encoder is slow enough for the decoder to lap it
+            frame = frame.copy()
+            if not reader.is_valid(seq):
+                reader.dropped += 1
+                continue
+            writer.write(frame)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.release()
+        bus.close()
+        print(f"Recording stopped, {reader.dropped} frames dropped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared-memory frame bus')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('decode', help='Decode a video into a new frame bus')
+    p.add_argument('video')
+    p.add_argument('--name', default='parking_frames')
+    p.add_argument('--slots', type=int, default=DEFAULT_SLOTS)
+    p.add_argument('--fps', type=float, default=None)
+    p = sub.add_parser('snapshot', help='Save the latest frame as an image')
+    p.add_argument('--name', default='parking_frames')
+    p.add_argument('--out', default='snapshot.jpg')
+    p = sub.add_parser('record', help='Record frames to a video file')
+    p.add_argument('--name', default='parking_frames')
+    p.add_argument('--out', default='recording.mp4')
+    p.add_argument('--fps', type=float, default=25)
+    args = parser.parse_args()
+
+    if args.command == 'decode':
+        run_decoder(args.video, args.name, slots=args.slots, fps=args.fps)
+    elif args.command == 'snapshot':
+        run_snapshot(args.name, args.out)
+    else:
+        run_recorder(args.name, args.out, fps=args.fps)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+# Pixels of context kept around the slots' bounding region, so Canny and the
+# resize see the same neighbourhood at the slot borders as on the full frame
+ROI_PADDING = 8
+
+
+class SlotLayout:
+    """
+    Slot boxes in normalized coordinates: each (x, y, w, h) is a fraction of the
+    frame width/height, so one layout serves streams of any resolution.
+    `source_size` is the (width, height) the layout was made at, for reference.
+    """
+
+    def __init__(self, boxes, source_size=None):
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.source_size = tuple(source_size) if source_size is not None else None
+
+    def __len__(self):
+        return len(self.boxes)
+
+    @classmethod
+    def from_boxes(cls, boxes, width, height):
+        """Layout from pixel (x, y, w, h) boxes drawn on a width x height frame"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        return cls(boxes / np.array([width, height, width, height], dtype=np.float64), (width, height))
+
+    @classmethod
+    def from_mask(cls, mask):
+        """Layout from a slot mask image (white slots on black), see util.get_parking_spots_bboxes"""
+        from util import get_parking_spots_bboxes
+
+        height, width = mask.shape[:2]
+        return cls.from_boxes(get_parking_spots_bboxes(mask), width, height)
+
+    @classmethod
+    def load(cls, path):
+        """A layout saved with save(), or a mask image"""
+        if os.path.splitext(path)[1].lower() == '.json':
+            with open(path) as f:
+                data = json.load(f)
+            return cls(data['boxes'], data.get('source_size'))
+        mask = cv2.imread(path, 0)
+        if mask is None:
+            raise FileNotFoundError(f"Mask missing at: {path}")
+        return cls.from_mask(mask)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'source_size': self.source_size, 'boxes': self.boxes.tolist()}, f)
+
+    def edges(self, width, height):
+        """Pixel (x0, y0, x1, y1) int arrays of every slot on a width x height frame"""
+        x0 = np.rint(self.boxes[:, 0] * width).astype(np.int64)
+        y0 = np.rint(self.boxes[:, 1] * height).astype(np.int64)
+        x1 = np.rint((self.boxes[:, 0] + self.boxes[:, 2]) * width).astype(np.int64)
+        y1 = np.rint((self.boxes[:, 1] + self.boxes[:, 3]) * height).astype(np.int64)
+        x0, y0 = np.clip(x0, 0, width - 1), np.clip(y0, 0, height - 1)
+        # Every slot keeps at least one pixel
+        x1, y1 = np.clip(np.maximum(x1, x0 + 1), 1, width), np.clip(np.maximum(y1, y0 + 1), 1, height)
+        return x0, y0, x1, y1
+
+    def to_pixels(self, width, height):
+        """List of pixel (x, y, w, h) boxes on a width x height frame"""
+        x0, y0, x1, y1 = self.edges(width, height)
+        return [(int(a), int(b), int(c - a), int(d - b)) for a, b, c, d in zip(x0, y0, x1, y1)]
+
+    def bounds(self, width, height, padding=ROI_PADDING):
+        """Pixel (x0, y0, x1, y1) region covering every slot, plus padding"""
+        if len(self.boxes) == 0:
+            return 0, 0, width, height
+        x0, y0, x1, y1 = self.edges(width, height)
+        return (max(int(x0.min()) - padding, 0), max(int(y0.min()) - padding, 0),
+                min(int(x1.max()) + padding, width), min(int(y1.max()) + padding, height))
+
+
+class ReducedView:
+    """
+    Working image for classification: only the slots' bounding region of a frame,
+    resized by `scale`, with the slot boxes mapped into it.
+
+    Per-frame work after extract() (colour conversion, integral images, Canny,
+    crops) scales with the working image, not the camera resolution.
+    """
+
+    def __init__(self, layout, width, height, scale=0.5):
+        self.scale = scale
+        self.roi = layout.bounds(width, height)
+        rx0, ry0, rx1, ry1 = self.roi
+        self.size = (max(1, round((rx1 - rx0) * scale)), max(1, round((ry1 - ry0) * scale)))
+        # Exact ratios of the resize, so boxes line up with the pixels they cover
+        sx, sy = self.size[0] / (rx1 - rx0), self.size[1] / (ry1 - ry0)
+        boxes = layout.boxes * np.array([width, height, width, height], dtype=np.float64)
+        local = np.column_stack([(boxes[:, 0] - rx0) * sx, (boxes[:, 1] - ry0) * sy,
+                                 boxes[:, 2] * sx, boxes[:, 3] * sy])
+        self.spots = SlotLayout.from_boxes(local, *self.size).to_pixels(*self.size)
+
+    def extract(self, frame):
+        rx0, ry0, rx1, ry1 = self.roi
+        region = frame[ry0:ry1, rx0:rx1]
+        if self.size == (rx1 - rx0, ry1 - ry0):
+            return region
+        return cv2.resize(region, self.size, interpolation=cv2.INTER_AREA)
+
+    def bytes_per_frame(self, channels=3):
+        """Bytes of the working image; compare with width * height * channels"""
+        return self.size[0] * self.size[1] * channels
+
+
+def report(model, layout, frames, scales=(1.0, 0.75, 0.5, 0.33)):
+    """
+    Accuracy of reduced-resolution classification against full resolution.
+    Every slot goes to the model (no tier-1 calibration) so only the input changes.
+    """
+    from cascade import CascadeClassifier
+
+    frames = list(frames)
+    if not frames:
+        print('No frames')
+        return
+    height, width = frames[0].shape[:2]
+    full = CascadeClassifier(model, layout.to_pixels(width, height), recalibrate_every=0)
+    started = time.perf_counter()
+    reference = [full.predict(frame, learn=False)[0] for frame in frames]
+    t_full = (time.perf_counter() - started) / len(frames)
+
+    frame_bytes = width * height * frames[0].shape[2]
+    print(f"Frames: {len(frames)} at {width}x{height}, {len(layout)} slots")
+    print(f"  {'scale':>6} {'working':>11} {'bytes':>7} {'agree':>8} {'ms/frame':>9}")
+    print(f"  {'full':>6} {f'{width}x{height}':>11} {100.0:6.1f}% {100.0:7.2f}% {t_full * 1000:9.1f}")
+    for scale in scales:
+        view = ReducedView(layout, width, height, scale)
+        cascade = CascadeClassifier(model, view.spots, recalibrate_every=0)
+        agree = 0
+        started = time.perf_counter()
+        for frame, ref in zip(frames, reference):
+            labels, _ = cascade.predict(view.extract(frame), learn=False)
+            agree += int((labels == ref).sum())
+        elapsed = (time.perf_counter() - started) / len(frames)
+        size = f'{view.size[0]}x{view.size[1]}'
+        print(f"  {scale:6.2f} {size:>11} {view.bytes_per_frame() / frame_bytes * 100:6.1f}% "
+              f"{agree / (len(frames) * len(layout)) * 100:7.2f}% {elapsed * 1000:9.1f}")
+
+
+class _BrightnessModel:
+    """Stand-in for the pickled model: a crop is occupied if it is mostly bright"""
+
+    def predict(self, X):
+        return (X.mean(axis=1) > 0.5).astype(np.int64)
+
+
+def check_resize(scales=(1.0, 0.5)):
+    """
+    Regression check for streams whose resolution differs from the layout's (and
+    changes midway): a ParkingMonitor with a 1920x1080 layout is fed 1280x720,
+    1920x1080 and 640x360 frames, one at a time and in mixed batches, and its
+    labels are compared with a monitor created at each size. Uses a stand-in
+    model, so it runs without the dataset. Returns the number of failures.
+    """
+    from engine import ParkingMonitor
+
+    rng = np.random.default_rng(0)
+    boxes = [(100 + 150 * (i % 10), 200 + 250 * (i // 10), 90, 160) for i in range(30)]
+    layout = SlotLayout.from_boxes(boxes, 1920, 1080)
+    sizes = [(1280, 720), (1920, 1080), (640, 360)]
+    frames = {}
+    for width, height in sizes:
+        frame = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+        for x, y, w, h in layout.to_pixels(width, height)[::3]:
+            frame[y:y + h, x:x + w] = 220
+        frames[(width, height)] = frame
+
+    failures = 0
+    for scale in scales:
+        def expected(size):
+            fresh = ParkingMonitor(model=_BrightnessModel(), layout=layout, frame_size=size, scale=scale)
+            return fresh.classify(frames[size], learn=False)[0]
+
+        monitor = ParkingMonitor(model=_BrightnessModel(), layout=layout, scale=scale)
+        for size in sizes + sizes[:1]:
+            try:
+                labels, _ = monitor.classify(frames[size], learn=False)
+                ok = np.array_equal(labels, expected(size)) and \
+                    np.array_equal(monitor.parking_spots, layout.to_pixels(*size))
+                occupancy = monitor.process_frame(frames[size])
+                ok = ok and occupancy is not None and len(occupancy) == len(layout)
+            except Exception as e:
+                ok = False
+                print(f"  {type(e).__name__}: {e}")
+            failures += not ok
+            print(f"  scale {scale:.2f} frame {size[0]}x{size[1]}: {'ok' if ok else 'FAILED'}")
+
+        batch = [frames[sizes[0]], frames[sizes[1]], frames[sizes[1]], frames[sizes[2]]]
+        try:
+            ok = monitor.process_batch(batch).shape == (len(batch), len(layout))
+        except Exception as e:
+            ok = False
+            print(f"  {type(e).__name__}: {e}")
+        failures += not ok
+        print(f"  scale {scale:.2f} mixed-size batch: {'ok' if ok else 'FAILED'}")
+    return failures
+
+
+def main():
+    import pickle
+    from cascade import iter_frames
+    from engine import MODEL_PATH, VIDEO_PATH, MASK_PATH
+
+    parser = argparse.ArgumentParser(description='Normalized slot layouts and reduced-resolution accuracy check')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help='Save the slot layout of a mask as normalized JSON')
+    export.add_argument('mask')
+    export.add_argument('output')
+
+    check = sub.add_parser('check', help='Compare reduced-resolution labels with full resolution')
+    check.add_argument('--layout', default=MASK_PATH, help='JSON layout or mask')
+    check.add_argument('--frames', help="Glob of frame dumps, e.g. 'dumps/*.jpg'")
+    check.add_argument('--video', default=VIDEO_PATH)
+    check.add_argument('--model', default=MODEL_PATH)
+    check.add_argument('--count', type=int, default=50, help='Maximum frames to use')
+    check.add_argument('--scales', default='1.0,0.75,0.5,0.33')
+
+    sub.add_parser('resize-check', help='Check classification when the stream resolution differs or changes')
+    args = parser.parse_args()
+
+    if args.command == 'resize-check':
+        failures = check_resize()
+        print('All sizes classified correctly' if not failures else f'{failures} check(s) failed')
+        return 1 if failures else 0
+
+    if args.command == 'export':
+        layout = SlotLayout.load(args.mask)
+        layout.save(args.output)
+        print(f"Saved {len(layout)} slots from {args.mask} to {args.output}")
+        return
+
+    with open(args.model, 'rb') as f:
+        model = pickle.load(f)
+    layout = SlotLayout.load(args.layout)
+    scales = [float(s) for s in args.scales.split(',')]
+    report(model, layout, iter_frames(args.frames, args.video, args.count), scales)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,24 +9,19 @@ try:
     import numpy as np
     from matplotlib.dates import DateFormatter
     from matplotlib.animation import FuncAnimation
+    from data_loader import load_data, recent_start, RECENT_MINUTES
+    from forecast import SeasonalForecaster
 except Exception as e:
     print(f"Missing packages: {e}")
     print("Install with: python -m pip install pandas matplotlib numpy")
     sys.exit(1)
 
 
-def read_data(csv_path):
+def read_data(csv_path, start=None, end=None):
     if not os.path.exists(csv_path):
         return pd.DataFrame()
-    df = pd.read_csv(csv_path)
-    if 'timestamp' in df.columns:
-        try:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        except Exception:
-            pass
-    if 'occupancy_percent' in df.columns:
-        df['occupancy_percent'] = pd.to_numeric(df['occupancy_percent'], errors='coerce')
-    return df
+    return load_data(csv_path, columns=['free_slots', 'occupied_slots', 'occupancy_percent', 'timestamp'],
+                     start=start, end=end)
 
 
 def ensure_plots_dir():
@@ -36,11 +31,17 @@ def ensure_plots_dir():
 
 
 class LiveDashboard:
-    def __init__(self, csv_path, interval=1000, window=300):
+    def __init__(self, csv_path, interval=1000, window=300, start=None, end=None):
         self.csv_path = csv_path
         self.interval = interval
         self.window = window
+        # Time window to show; a relative start like '-2h' slides with each update.
+        # Without either, the last RECENT_MINUTES up to the newest row are shown
+        self.start = start
+        self.end = end
         self.plots_dir = ensure_plots_dir()
+        # Saved seasonal profile, kept current with the rows read on each update
+        self.forecaster = SeasonalForecaster.load_or_new()
 
         # Setup figure with 3 subplots
         self.fig, (self.ax_time, self.ax_bar, self.ax_ma) = plt.subplots(3, 1, figsize=(10, 10))
@@ -54,10 +55,13 @@ class LiveDashboard:
         self.ax_time.set_title('Occupancy % vs Time')
         self.ax_time.set_ylabel('Occupancy (%)')
         self.ax_ma.set_title('Moving Average + Forecast')
-        self.ax_ma.set_xlabel('Frame Index')
+        self.ax_ma.set_xlabel('Time')
 
     def update(self, frame=None):
-        df = read_data(self.csv_path)
+        start = self.start
+        if start is None and self.end is None:
+            start = recent_start(self.csv_path)
+        df = read_data(self.csv_path, start, self.end)
         if df.empty:
             return
 
@@ -83,29 +87,22 @@ class LiveDashboard:
         for i, v in enumerate([free, occupied]):
             self.ax_bar.text(i, v, f'{v:.0f}', ha='center', va='bottom')
 
-        # Moving average and simple forecast
+        # Moving average and seasonal forecast
         series = df['occupancy_percent'].astype(float).reset_index(drop=True)
         ma = series.rolling(window=min(self.window, len(series)), min_periods=1).mean()
         self.ax_ma.cla()
-        idx = np.arange(len(series))
-        self.ax_ma.plot(idx, series, label='raw', alpha=0.4)
-        self.ax_ma.plot(idx, ma, label=f'MA (window={min(self.window, len(series))})')
-
-        # Linear forecast from last up-to-200 samples
-        n_fit = min(200, len(series))
-        if n_fit >= 2:
-            x_fit = np.arange(n_fit)
-            y_fit = series.iloc[-n_fit:].values
-            coeffs = np.polyfit(x_fit, y_fit, 1)
-            poly = np.poly1d(coeffs)
-            x_fore = np.arange(len(series), len(series) + int(self.interval/1000 * 5))
-            # scale x_fore to fit linear fit domain
-            x_fore_fit = x_fit[-1] + (x_fore - len(series) + 1)
-            y_fore = poly(x_fore_fit)
-            self.ax_ma.plot(x_fore, y_fore, '--', color='orange', label='forecast')
+        x = df['timestamp']
+        self.ax_ma.plot(x, series, label='raw', alpha=0.4)
+        self.ax_ma.plot(x, ma, label=f'MA (window={min(self.window, len(series))})')
+
+        # Only rows newer than the profile are read and absorbed (the shown window
+        # may not reach back to them); the forecast itself is a lookup
+        self.forecaster.refresh(self.csv_path)
+        forecast = self.forecaster.forecast(60, step_minutes=1, start=df['timestamp'].max())
+        self.ax_ma.plot(forecast.index, forecast.values, '--', color='orange', label='forecast')
 
         self.ax_ma.set_title('Moving Average + Forecast')
-        self.ax_ma.set_xlabel('Frame Index')
+        self.ax_ma.set_xlabel('Time')
         self.ax_ma.set_ylabel('Occupancy (%)')
         self.ax_ma.legend()
         self.ax_ma.grid(alpha=0.3)
@@ -125,9 +122,12 @@ def main():
     parser.add_argument('--interval', type=int, default=1000, help='Update interval in ms')
     parser.add_argument('--window', type=int, default=30, help='Moving average window (frames)')
     parser.add_argument('--test', action='store_true', help='Run one update and exit (save snapshot)')
+    parser.add_argument('--start', help="Only rows from this time: ISO timestamp or relative like --start=-2h "
+                                        f"(default: the {RECENT_MINUTES} minutes up to the newest row)")
+    parser.add_argument('--end', help='Only rows up to this time')
     args = parser.parse_args()
 
-    dash = LiveDashboard(args.csv, interval=args.interval, window=args.window)
+    dash = LiveDashboard(args.csv, interval=args.interval, window=args.window, start=args.start, end=args.end)
     if args.test:
         dash.update()
         print('Saved test snapshot(s) to plots/')
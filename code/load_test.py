@@ -0,0 +1,154 @@
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+# Each fake viewer behaves like templates/index.html: poll the counts, and every
+# few seconds fetch the three plots.
+CHEAP_PATHS = ['/api/latest', '/api/health', '/api/forecast?minutes=60']
+PLOT_PATHS = ['/plot/occupancy.png', '/plot/bar.png', '/plot/moving.png']
+
+
+def start_local_server(csv_path=None):
+    """
+    Run web_dashboard in this process on a free port, with the same server as
+    web_dashboard.serve() (waitress if installed); returns (base url, server)
+    """
+    import web_dashboard
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('waitress').setLevel(logging.ERROR)
+    if csv_path is not None:
+        web_dashboard.CSV_PATH = web_dashboard.live.csv_path = web_dashboard.forecasts.csv_path = csv_path
+        # Keep the churned data out of the real forecast profile
+        web_dashboard.forecasts.path = os.path.join(os.path.dirname(csv_path), 'forecast_profile.npz')
+    web_dashboard.live.start()
+    web_dashboard.forecasts.start()
+    server = web_dashboard.create_server('127.0.0.1', 0)
+    threading.Thread(target=server.run, daemon=True).start()
+    return f'http://127.0.0.1:{server.port}', server
+
+
+def churn(csv_path, rate, stop):
+    """Append a row `rate` times a second, like a running main.py, so plots go stale"""
+    from datetime import datetime
+
+    frame = 0
+    while not stop.wait(1.0 / rate):
+        frame += 1
+        occupied = frame % 300
+        with open(csv_path, 'a') as f:
+            f.write(f"{313 - occupied},{occupied},313,{occupied / 313 * 100:.1f},{frame},"
+                    f"{datetime.now().isoformat(timespec='milliseconds')}\n")
+
+
+def fetch(url, timeout):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, time.perf_counter() - started
+
+
+def viewer(base, duration, plot_every, timeout, results, lock):
+    deadline = time.monotonic() + duration
+    next_plots = time.monotonic()
+    while time.monotonic() < deadline:
+        paths = list(CHEAP_PATHS)
+        if time.monotonic() >= next_plots:
+            paths += PLOT_PATHS
+            next_plots += plot_every
+        for path in paths:
+            status, elapsed = fetch(base + path, timeout)
+            kind = 'plot' if path in PLOT_PATHS else 'cheap'
+            with lock:
+                results.append((kind, status, elapsed))
+        time.sleep(0.05)
+
+
+def run_level(base, viewers, duration, plot_every, timeout):
+    results = []
+    lock = threading.Lock()
+    threads = [threading.Thread(target=viewer, args=(base, duration, plot_every, timeout, results, lock))
+               for _ in range(viewers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summarize(results, kind):
+    ok = np.array([elapsed for k, status, elapsed in results if k == kind and status == 200]) * 1000
+    busy = sum(1 for k, status, _ in results if k == kind and status == 503)
+    failed = sum(1 for k, status, _ in results if k == kind and status not in (200, 503))
+    if len(ok) == 0:
+        return f"{'-':>8} {'-':>8} {0:>6} {busy:>5} {failed:>5}"
+    return f"{np.percentile(ok, 50):8.1f} {np.percentile(ok, 99):8.1f} {len(ok):6d} {busy:5d} {failed:5d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake-viewer load test for web_dashboard.py')
+    parser.add_argument('--url', help='dashboard to test (default: start one in this process)')
+    parser.add_argument('--viewers', default='1,4,16,32', help='comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per level')
+    parser.add_argument('--plot-every', type=float, default=3.0, help='seconds between plot refreshes per viewer')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--churn', type=float, default=0,
+                        help='local mode: append rows to a copy of the CSV this many times a second')
+    args = parser.parse_args()
+
+    server = None
+    stop = threading.Event()
+    tmpdir = None
+    base = args.url.rstrip('/') if args.url else None
+    if base is None:
+        csv_path = None
+        if args.churn > 0:
+            import web_dashboard
+
+            tmpdir = tempfile.mkdtemp()
+            csv_path = os.path.join(tmpdir, 'parking_data.csv')
+            if os.path.exists(web_dashboard.CSV_PATH):
+                shutil.copy(web_dashboard.CSV_PATH, csv_path)
+            else:
+                with open(csv_path, 'w') as f:
+                    f.write('free_slots,occupied_slots,total_slots,occupancy_percent,frame_number,timestamp\n')
+            threading.Thread(target=churn, args=(csv_path, args.churn, stop), daemon=True).start()
+        base, server = start_local_server(csv_path)
+    print(f"Target: {base}")
+    # Warm up the render workers so the first level doesn't pay for process start
+    for path in PLOT_PATHS:
+        fetch(base + path, args.timeout)
+
+    print(f"\n{'':>8} {'cheap routes (ms)':>33} | {'plots (ms)':>33}")
+    print(f"{'viewers':>8} {'p50':>8} {'p99':>8} {'n':>6} {'503':>5} {'err':>5} | "
+          f"{'p50':>8} {'p99':>8} {'n':>6} {'503':>5} {'err':>5}")
+    for level in [int(v) for v in args.viewers.split(',')]:
+        results = run_level(base, level, args.duration, args.plot_every, args.timeout)
+        print(f"{level:8d} {summarize(results, 'cheap')} | {summarize(results, 'plot')}")
+
+    stop.set()
+    if tmpdir is not None:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if server is not None:
+        server.stop()
+        import web_dashboard
+        print("\nRender pool:", web_dashboard.pool.stats)
+        web_dashboard.pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
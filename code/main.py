@@ -1,206 +1,142 @@
-print("Program started")
-
+import os
 import sys
-sys.path.append('.')
-import csv
 import time
-import os
-from datetime import datetime
-import cv2
-import pickle
-import numpy as np
-from skimage.transform import resize
-from collections import defaultdict, deque
-
-from util import get_parking_spots_bboxes
-
-# Create CSV file to store per-frame parking data (append mode so data accumulates across runs)
-# Columns: free_slots, occupied_slots, total_slots, occupancy_percent, frame_number, timestamp
-csv_path = os.path.join(os.path.dirname(__file__), 'parking_data.csv')
-file_exists = os.path.exists(csv_path) and os.path.getsize(csv_path) > 0
-csv_file = open(csv_path, 'a', newline='')
-csv_writer = csv.writer(csv_file)
-if not file_exists:
-    csv_writer.writerow(['free_slots', 'occupied_slots', 'total_slots', 'occupancy_percent', 'frame_number', 'timestamp'])
-
-# Load trained model
-# with open('../dataset/archive (1)/parking/model/model.p', 'rb') as f:
-#     model = pickle.load(f)
-
-
-
-# Always correct absolute path based on project folder
-MODEL_PATH = os.path.join(
-    os.path.dirname(os.path.dirname(__file__)),  
-    'dataset',
-    'archive (1)',
-    'parking',
-    'model',
-    'model.p'
-)
-
-MODEL_PATH = os.path.abspath(MODEL_PATH)
-print("Model path:", MODEL_PATH)
-
-with open(MODEL_PATH, 'rb') as f:
-    model = pickle.load(f)
-
-# Load video and mask
-# video = cv2.VideoCapture(r'../dataset/archive (1)/parking/parking_1920_1080_loop.mp4')
-  
-
-# Build absolute path for video
-VIDEO_PATH = os.path.join(
-    os.path.dirname(os.path.dirname(__file__)),  # go one folder up
-    'dataset',
-    'archive (1)',
-    'parking',
-    'parking_1920_1080_loop.mp4'
-)
-VIDEO_PATH = os.path.abspath(VIDEO_PATH)
-print("Video path:", VIDEO_PATH)
-
-video = cv2.VideoCapture(VIDEO_PATH)
-
-if not video.isOpened():
-    print(f"ERROR: Could not open video at {VIDEO_PATH}")
-    raise FileNotFoundError(f"Video missing at: {VIDEO_PATH}")
-
-
-
-
-
-# mask = cv2.imread(r'../dataset/archive (1)/parking/mask_1920_1080.png', 0)
-
-
-
 
-# Build correct path for mask
-MASK_PATH = os.path.join(
-    os.path.dirname(os.path.dirname(__file__)),
-    'dataset',
-    'archive (1)',
-    'parking',
-    'mask_1920_1080.png'
-)
-
-MASK_PATH = os.path.abspath(MASK_PATH)
-print("Mask path:", MASK_PATH)
-
-mask = cv2.imread(MASK_PATH, 0)
-
-if mask is None:
-    print("ERROR: Mask not found!")
-    raise FileNotFoundError(f"Mask missing at: {MASK_PATH}")
-
-print("Mask loaded successfully!")
-
-
-
-
-# Get parking spot boxes
-parking_spots = get_parking_spots_bboxes(mask)
-
-print(f"\n{'='*60}")
-print(f"Total parking spots detected: {len(parking_spots)}")
-print(f"{'='*60}\n")
-
-# Temporal smoothing: store predictions for last 5 frames per slot
-HISTORY_SIZE = 5
-CONFIDENCE_THRESHOLD = 0.4
-slot_history = defaultdict(lambda: deque(maxlen=HISTORY_SIZE))
-
-frame_count = 0
-
-try:
-    while True:
-        ret, frame = video.read()
-        if not ret:
-            video.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
+sys.path.append('.')
+import cv2
 
-        frame_count += 1
-        free_count = 0
+from engine import ParkingMonitor, CsvSink, BinaryStoreSink, OverlaySink, MODEL_PATH, VIDEO_PATH, MASK_PATH
+from frame_bus import FrameBus, FrameReader
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Per-frame summary: free_slots, occupied_slots, total_slots, occupancy_percent, frame_number, timestamp
+# (append mode so data accumulates across runs; rotated/compacted by retention.py)
+CSV_PATH = os.path.join(CODE_DIR, 'parking_data.csv')
+# Tier-1 cascade thresholds are recalibrated as it runs and kept across runs
+CALIBRATION_PATH = os.path.join(CODE_DIR, 'cascade_calibration.npz')
+# After a frame bus slot is overwritten mid-classification, this many frames are
+# copied out of the bus before classifying (then zero-copy is tried again)
+COPY_AFTER_DROP = 100
+
+
+def main():
+    print("Program started")
+    print("Model path:", MODEL_PATH)
+    print("Video path:", VIDEO_PATH)
+    print("Mask path:", MASK_PATH)
+
+    # PARKING_LAYOUT: normalized slot layout (python code/layout.py export <mask> <json>);
+    # the mask itself is used by default. PARKING_SCALE < 1 classifies a downscaled
+    # copy of the slots' region instead of the full frame.
+    layout = os.environ.get('PARKING_LAYOUT') or MASK_PATH
+    scale = float(os.environ.get('PARKING_SCALE', 1.0))
+    monitor = ParkingMonitor(MODEL_PATH, layout=layout, calibration_path=CALIBRATION_PATH, scale=scale)
+    print(f"\n{'='*60}")
+    print(f"Total parking spots detected: {monitor.total_slots}")
+    print(f"{'='*60}\n")
+
+    monitor.add_sink(CsvSink(CSV_PATH))
+    # Optional dense per-slot occupancy store (see slot analytics)
+    slot_store = os.environ.get('PARKING_SLOT_STORE')
+    if slot_store:
+        monitor.add_sink(BinaryStoreSink(slot_store))
+    # PARKING_HEADLESS=1 skips the local window; the overlay is then only drawn
+    # while the dashboard's stream has a viewer
+    show_window = os.environ.get('PARKING_HEADLESS', '0') in ('', '0')
+    annotated_bus = None
+    overlay = monitor.add_sink(OverlaySink(
+        active=lambda: show_window or (annotated_bus is not None and annotated_bus.has_readers())))
+
+    # Optionally consume frames from a shared-memory frame bus instead of decoding here
+    # (start the decoder with: python code/frame_bus.py decode <video> --name <name>)
+    frame_bus_name = os.environ.get('PARKING_FRAME_BUS')
+    frame_bus = None
+    frame_reader = None
+    video = None
+    if frame_bus_name:
+        frame_bus = FrameBus.attach(frame_bus_name)
+        frame_reader = FrameReader(frame_bus, policy='latest')
+        frame_shape = frame_bus.shape
+        print(f"Reading frames from frame bus '{frame_bus_name}'")
+    else:
+        video = cv2.VideoCapture(VIDEO_PATH)
+        if not video.isOpened():
+            print(f"ERROR: Could not open video at {VIDEO_PATH}")
+            raise FileNotFoundError(f"Video missing at: {VIDEO_PATH}")
+        frame_shape = (int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+
+    # Annotated frames for the web dashboard's MJPEG stream; only copied in while
+    # the dashboard has a viewer connected
+    annotated_bus_name = os.environ.get('PARKING_ANNOTATED_BUS', 'parking_annotated')
+    try:
+        annotated_bus = FrameBus.create(name=annotated_bus_name, slots=3, shape=frame_shape)
+    except FileExistsError:
+        print(f"Annotated frame bus '{annotated_bus_name}' already exists, live stream disabled")
 
-        for slot_idx, (x, y, w, h) in enumerate(parking_spots):
-            crop = frame[y:y+h, x:x+w]
-            
-            # Check pixel intensity - ignore very dark/bright regions
-            mean_intensity = np.mean(crop)
-            if mean_intensity < 20 or mean_intensity > 240:
-                # Skip extremely dark or bright regions
-                final_prediction = 1  # Mark as occupied if can't determine
-            else:
-                # Use 15x15 exactly like the model was trained
-                crop_resized = resize(crop, (15, 15, 3))
-                crop_flat = crop_resized.flatten().reshape(1, -1)
-                
-                # Get prediction from model
-                prediction = model.predict(crop_flat)[0]
-                
-                # Add to history for temporal smoothing
-                slot_history[slot_idx].append(prediction)
-                
-                # Get majority vote from history (only use if we have enough history)
-                if len(slot_history[slot_idx]) >= HISTORY_SIZE:
-                    history_list = list(slot_history[slot_idx])
-                    # Count 0s and non-0s for temporal smoothing
-                    empty_votes = sum(1 for p in history_list if p == 0)
-                    occupied_votes = len(history_list) - empty_votes
-                    # Use majority vote
-                    final_prediction = 0 if empty_votes > occupied_votes else 1
+    copy_frames = 0
+    try:
+        while True:
+            if frame_reader is not None:
+                seq, frame = frame_reader.read()
+                if copy_frames:
+                    # Classification is outlasting the ring: take a private copy
+                    # (a memcpy, far shorter than classifying) and check it is intact
+                    copy_frames -= 1
+                    frame = frame.copy()
+                    if not frame_reader.is_valid(seq):
+                        monitor.dropped += 1
+                        continue
+                    monitor.process_frame(frame)
                 else:
-                    # During warmup phase, use direct prediction
-                    final_prediction = prediction
-
-            # prediction: 0 = EMPTY (free/green), 1 = NOT_EMPTY (occupied/red)
-            if final_prediction == 0:
-                color = (0, 255, 0)  # GREEN for empty
-                free_count += 1
+                    # Classified straight from the read-only bus view; dropped if
+                    # the decoder overwrote the slot meanwhile
+                    occupancy = monitor.process_frame(frame, valid=lambda: frame_reader.is_valid(seq))
+                    del frame
+                    if occupancy is None:
+                        copy_frames = COPY_AFTER_DROP
+                        print(f"Frame bus slot overwritten during classification ({monitor.dropped} dropped so far), "
+                              f"copying the next {COPY_AFTER_DROP} frames")
+                        continue
             else:
-                color = (0, 0, 255)   # RED for occupied
-
-            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-
-        cv2.putText(frame, f'Free slots: {free_count} | Total: {len(parking_spots)}',
-                    (50, 50), cv2.FONT_HERSHEY_SIMPLEX,
-                    1, (255, 255, 255), 2)
-        
-        occupied_count = len(parking_spots) - free_count
-        occupancy_percent = (occupied_count / len(parking_spots) * 100) if len(parking_spots) > 0 else 0
-        # Record occupancy data to CSV for this frame (use ISO timestamp with milliseconds)
-        timestamp = datetime.now().isoformat(timespec='milliseconds')
-        csv_writer.writerow([free_count, occupied_count, len(parking_spots), f"{occupancy_percent:.1f}", frame_count, timestamp])
-        csv_file.flush()  # Flush to disk so data is saved immediately
-        try:
-            os.fsync(csv_file.fileno())
-        except Exception:
-            pass
-        
-        cv2.putText(frame, f'Occupied: {occupied_count} | Occupancy: {occupancy_percent:.1f}%',
-                    (50, 90), cv2.FONT_HERSHEY_SIMPLEX,
-                    1, (255, 255, 255), 2)
-        
-        cv2.putText(frame, f'Frame: {frame_count}',
-                    (50, 130), cv2.FONT_HERSHEY_SIMPLEX,
-                    0.7, (200, 200, 200), 1)
-
-        cv2.imshow('Smart Parking System', frame)
-
-        if cv2.waitKey(30) & 0xFF == 27:
-            break
-except KeyboardInterrupt:
-    pass
-except Exception as e:
-    print("Error during processing:", e)
-finally:
-    video.release()
-    cv2.destroyAllWindows()
-    print("Program finished")
-    print("Model type:", type(model))
-    # Close CSV file
-    try:
-        csv_file.close()
-    except Exception:
+                ret, frame = video.read()
+                if not ret:
+                    video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                # Classify, record to the sinks and draw the overlay onto the frame
+                monitor.process_frame(frame)
+
+            annotated = overlay.frame
+            if annotated is not None:
+                if annotated_bus is not None and annotated_bus.has_readers() and annotated.shape == annotated_bus.shape:
+                    annotated_bus.publish(annotated)
+                if show_window:
+                    cv2.imshow('Smart Parking System', annotated)
+
+            if show_window:
+                if cv2.waitKey(30) & 0xFF == 27:
+                    break
+            elif frame_reader is None:
+                # Same pace as the window's waitKey (the bus sets its own pace)
+                time.sleep(0.03)
+    except KeyboardInterrupt:
         pass
-
+    except Exception as e:
+        print("Error during processing:", e)
+    finally:
+        if video is not None:
+            video.release()
+        if frame_bus is not None:
+            print(f"Frames dropped after being overwritten on the frame bus: {monitor.dropped}")
+            frame_reader = None
+            frame_bus.close()
+        if annotated_bus is not None:
+            annotated_bus.close()
+        if show_window:
+            cv2.destroyAllWindows()
+        monitor.close()
+        print("Program finished")
+        print("Model type:", type(monitor.model))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import time
+import threading
+
+import cv2
+
+from frame_bus import FrameBus, FrameReader
+
+BOUNDARY = 'frame'
+
+# Seconds without a new frame before the bus is re-attached: if main.py restarted
+# it recreated the bus, and the old segment will never get another frame
+REATTACH_AFTER = 3.0
+
+
+class StreamFull(Exception):
+    """Raised by subscribe() when max_clients viewers are already connected"""
+
+
+class MjpegBroadcaster:
+    """
+    Serves one MJPEG stream of a frame bus to any number of HTTP clients.
+
+    A single encoder thread runs only while at least one client is connected:
+    each frame is resized and JPEG-encoded once and the same bytes are handed
+    to every client. With no clients the thread exits and stops touching the
+    bus heartbeat, so the publisher (main.py) also stops copying frames.
+
+    Each connected client holds a server thread for as long as it watches, so at
+    most `max_clients` (None = no limit) are admitted.
+    """
+
+    def __init__(self, bus_name, width=0, height=0, fps=10, quality=80, max_clients=None):
+        self.bus_name = bus_name
+        self.max_clients = max_clients
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.quality = quality
+
+        self.cond = threading.Condition()
+        self.clients = 0
+        self.thread = None
+        self.jpeg = None
+        self.jpeg_id = 0
+
+    def _output_size(self, shape):
+        h, w = shape[:2]
+        if self.width and self.height:
+            return self.width, self.height
+        if self.width:
+            return self.width, max(1, round(h * self.width / w))
+        if self.height:
+            return max(1, round(w * self.height / h)), self.height
+        return w, h
+
+    def _encode_loop(self):
+        bus = None
+        reader = None
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(self.quality)]
+        last_frame = time.monotonic()
+        try:
+            while True:
+                with self.cond:
+                    if self.clients == 0:
+                        self.thread = None
+                        return
+                started = time.monotonic()
+                if bus is None:
+                    try:
+                        bus = FrameBus.attach(self.bus_name)
+                        reader = FrameReader(bus, policy='latest')
+                        last_frame = time.monotonic()
+                    except FileNotFoundError:
+                        # Publisher not running yet
+                        time.sleep(1.0)
+                        continue
+                bus.touch()
+                seq, frame = reader.read(timeout=0.5)
+                if seq is None:
+                    if time.monotonic() - last_frame >= REATTACH_AFTER:
+                        reader = None
+                        bus.close()
+                        bus = None
+                    continue
+                last_frame = time.monotonic()
+                size = self._output_size(frame.shape)
+                if size != (frame.shape[1], frame.shape[0]):
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                ok, buf = cv2.imencode('.jpg', frame, params)
+                del frame
+                if ok and reader.is_valid(seq):
+                    with self.cond:
+                        self.jpeg = buf.tobytes()
+                        self.jpeg_id += 1
+                        self.cond.notify_all()
+                time.sleep(max(0.0, 1.0 / self.fps - (time.monotonic() - started)))
+        finally:
+            reader = None
+            if bus is not None:
+                bus.close()
+
+    def subscribe(self):
+        """
+        Iterator of multipart chunks for one client; pass it to a streaming
+        response with mimetype 'multipart/x-mixed-replace; boundary=frame'.
+        The client's place is taken now (StreamFull if there is none) and given
+        back when the server closes the iterator.
+        """
+        with self.cond:
+            if self.max_clients is not None and self.clients >= self.max_clients:
+                raise StreamFull()
+            self.clients += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._encode_loop, daemon=True)
+                self.thread.start()
+            # Only frames encoded from now on; never replay a stale frame
+            return _Subscription(self, self.jpeg_id)
+
+    def _release(self):
+        with self.cond:
+            self.clients -= 1
+
+
+class _Subscription:
+    """One client's stream. A class rather than a generator so close() frees the
+    client's place even if the server never started iterating it."""
+
+    def __init__(self, broadcaster, last_id):
+        self.broadcaster = broadcaster
+        self.last_id = last_id
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        b = self.broadcaster
+        while not self.closed:
+            with b.cond:
+                b.cond.wait_for(lambda: b.jpeg_id != self.last_id, timeout=5.0)
+                if b.jpeg_id == self.last_id:
+                    continue
+                jpeg, self.last_id = b.jpeg, b.jpeg_id
+            return (b'--' + BOUNDARY.encode() + b'\r\n'
+                    b'Content-Type: image/jpeg\r\n'
+                    b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+        raise StopIteration
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broadcaster._release()
@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+
+FREE_COLOR = (0, 255, 0)       # GREEN for empty
+OCCUPIED_COLOR = (0, 0, 255)   # RED for occupied
+OUTLINE_THICKNESS = 2
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class TextPanel:
+    """
+    One line of overlay text. putText antialiases against the pixels underneath,
+    so text is drawn straight onto each frame rather than cached in a layer.
+    """
+
+    def __init__(self, org, scale, color, thickness):
+        self.org = org
+        self.scale = scale
+        self.color = color
+        self.thickness = thickness
+        self.text = None
+
+    def draw(self, frame):
+        if self.text:
+            cv2.putText(frame, self.text, self.org, FONT, self.scale, self.color, self.thickness)
+
+
+class SlotOverlay:
+    """
+    Cached overlay of slot outlines and status text, composited onto frames.
+
+    Produces the same pixels as drawing every outline with cv2.rectangle (in slot
+    order) followed by the text lines with cv2.putText, but only slots whose state
+    changed are redrawn into the outline layer. Compositing is a single masked
+    copy over the bounding region of the outlines, then the few text lines.
+    """
+
+    def __init__(self, parking_spots, frame_shape):
+        self.spots = list(parking_spots)
+        h, w = frame_shape[:2]
+        self.shape = (h, w)
+
+        # Outline layer and the mask of its drawn pixels
+        self.layer = np.zeros((h, w, 3), dtype=np.uint8)
+        self.mask = np.zeros((h, w), dtype=np.uint8)
+
+        self.states = np.full(len(self.spots), -1, dtype=np.int16)
+        pad = OUTLINE_THICKNESS
+        self.bounds = [self._clip((x - pad, y - pad, x + bw + pad + 1, y + bh + pad + 1))
+                       for x, y, bw, bh in self.spots]
+        # Outlines drawn later cover earlier ones; redrawing a slot means redrawing
+        # every later slot it overlaps so the stacking order is preserved
+        self.later_overlaps = [
+            [j for j in range(i + 1, len(self.bounds)) if _overlaps(self.bounds[i], self.bounds[j])]
+            for i in range(len(self.bounds))
+        ]
+
+        self.panels = []
+        self.roi = self._union(self.bounds) if self.bounds else None
+
+    def _clip(self, rect):
+        h, w = self.shape
+        return (max(0, rect[0]), max(0, rect[1]), min(w, rect[2]), min(h, rect[3]))
+
+    @staticmethod
+    def _union(rects):
+        rects = list(rects)
+        return (min(r[0] for r in rects), min(r[1] for r in rects),
+                max(r[2] for r in rects), max(r[3] for r in rects))
+
+    def add_text(self, org, scale, color, thickness):
+        """Register a text line; returns its index for update()"""
+        self.panels.append(TextPanel(org, scale, color, thickness))
+        return len(self.panels) - 1
+
+    def _draw_slot(self, idx):
+        x, y, w, h = self.spots[idx]
+        color = FREE_COLOR if self.states[idx] == 0 else OCCUPIED_COLOR
+        cv2.rectangle(self.layer, (x, y), (x + w, y + h), color, OUTLINE_THICKNESS)
+        cv2.rectangle(self.mask, (x, y), (x + w, y + h), 1, OUTLINE_THICKNESS)
+
+    def update(self, states, texts=()):
+        """
+        states: per-slot 0 (free) / 1 (occupied); texts: one string per panel
+        """
+        states = np.asarray(states, dtype=np.int16)
+        changed = np.flatnonzero(states != self.states)
+        self.states[:] = states
+
+        if len(changed):
+            redraw = set()
+            pending = changed.tolist()
+            while pending:
+                idx = pending.pop()
+                if idx not in redraw:
+                    redraw.add(idx)
+                    pending.extend(self.later_overlaps[idx])
+            for idx in sorted(redraw):
+                self._draw_slot(idx)
+
+        for panel, text in zip(self.panels, texts):
+            panel.text = text
+
+    def composite(self, frame):
+        """Draw the overlay onto the frame in place (one masked copy, then the text)"""
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            cv2.copyTo(self.layer[y0:y1, x0:x1], self.mask[y0:y1, x0:x1], frame[y0:y1, x0:x1])
+        for panel in self.panels:
+            panel.draw(frame)
+        return frame
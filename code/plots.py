@@ -0,0 +1,121 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.dates import DateFormatter
+
+from data_loader import load_data, read_latest, recent_start, RECENT_MINUTES
+from forecast import forecast_after
+
+# Minutes of seasonal forecast drawn after the data
+FORECAST_MINUTES = 60
+
+# Dashboard plots, rendered to PNG bytes. These run in the render pool's worker
+# processes (see render_pool.py), so they take only picklable arguments and read
+# the data themselves. start/end restrict a plot to a time window (see
+# data_loader.parse_time); only that part of the data is read. Without either,
+# the time-series plots show the last RECENT_MINUTES.
+
+
+def read_data(csv_path, start=None, end=None):
+    if not os.path.exists(csv_path):
+        return pd.DataFrame()
+    return load_data(csv_path, columns=['free_slots', 'occupied_slots', 'occupancy_percent', 'timestamp'],
+                     start=start, end=end)
+
+
+def fig_to_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def render_occupancy(csv_path, start=None, end=None):
+    if start is None and end is None:
+        start = recent_start(csv_path)
+    df = read_data(csv_path, start, end)
+    fig, ax = plt.subplots(figsize=(10, 4))
+    if df.empty or 'occupancy_percent' not in df.columns:
+        ax.text(0.5, 0.5, 'No data available', ha='center', va='center')
+    else:
+        x = df['timestamp'] if 'timestamp' in df.columns else np.arange(len(df))
+        y = df['occupancy_percent']
+        ax.plot(x, y, marker='.', linewidth=1)
+        ax.set_title('Occupancy % vs Time')
+        ax.set_ylabel('Occupancy (%)')
+        if 'timestamp' in df.columns:
+            ax.xaxis.set_major_formatter(DateFormatter('%H:%M:%S'))
+            fig.autofmt_xdate()
+        ax.grid(alpha=0.3)
+    return fig_to_png(fig)
+
+
+def render_bar(csv_path, start=None, end=None):
+    if end is None:
+        # Only the latest row is shown
+        last = read_latest(csv_path) if os.path.exists(csv_path) else None
+    else:
+        df = read_data(csv_path, start, end)
+        last = df.iloc[-1] if not df.empty else None
+    fig, ax = plt.subplots(figsize=(6, 4))
+    if last is None or 'free_slots' not in last:
+        ax.text(0.5, 0.5, 'No data available', ha='center', va='center')
+    else:
+        free = last['free_slots']
+        occ = last['occupied_slots']
+        bars = ax.bar(['Free', 'Occupied'], [free, occ], color=['green', 'red'])
+        ax.set_title('Current Free vs Occupied')
+        for bar in bars:
+            y = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2, y, f'{y:.0f}', ha='center', va='bottom')
+    return fig_to_png(fig)
+
+
+def render_moving(csv_path, start=None, end=None):
+    recent_only = start is None and end is None
+    if recent_only:
+        start = recent_start(csv_path)
+    df = read_data(csv_path, start, end)
+    fig, ax = plt.subplots(figsize=(10, 4))
+    if df.empty or 'occupancy_percent' not in df.columns:
+        ax.text(0.5, 0.5, 'No data available', ha='center', va='center')
+    else:
+        series = df['occupancy_percent'].astype(float).reset_index(drop=True)
+        ma = series.rolling(window=min(30, len(series)), min_periods=1).mean()
+        forecast = forecast_after(df, minutes=FORECAST_MINUTES)
+        if forecast is not None:
+            x = df['timestamp'].reset_index(drop=True)
+            if recent_only:
+                recent = x >= x.max() - pd.Timedelta(minutes=RECENT_MINUTES)
+                x, series, ma = x[recent], series[recent], ma[recent]
+        else:
+            x = np.arange(len(series))
+        ax.plot(x, series, label='raw', alpha=0.4)
+        ax.plot(x, ma, label='MA (30)', linewidth=2)
+        if forecast is not None:
+            ax.plot(forecast.index, forecast.values, '--', color='orange', label='seasonal forecast')
+            ax.xaxis.set_major_formatter(DateFormatter('%H:%M'))
+            fig.autofmt_xdate()
+        ax.set_title('Moving Average + Forecast')
+        ax.set_xlabel('Time' if forecast is not None else 'Frame index')
+        ax.set_ylabel('Occupancy (%)')
+        ax.legend()
+        ax.grid(alpha=0.3)
+    return fig_to_png(fig)
+
+
+RENDERERS = {
+    'occupancy': render_occupancy,
+    'bar': render_bar,
+    'moving': render_moving,
+}
+
+
+def render(name, csv_path, start=None, end=None):
+    """Entry point for worker processes"""
+    return RENDERERS[name](csv_path, start, end)
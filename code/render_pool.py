@@ -0,0 +1,79 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class RenderPoolBusy(Exception):
+    """Raised when the render queue is full; callers should answer 503"""
+
+
+class RenderPool:
+    """
+    Bounded process pool for plot rendering with request coalescing.
+
+    Rendering happens in worker processes, so it never holds the web server's GIL.
+    Requests for the same (args) while a render is in flight share its future,
+    and the last result per args is kept so repeated requests for unchanged data
+    are answered without rendering. At most `max_pending` distinct renders may
+    be queued or running; beyond that submit() raises RenderPoolBusy. Results
+    are kept for the `max_cached` most recently finished args.
+    """
+
+    def __init__(self, fn, max_workers=2, max_pending=8, max_cached=32):
+        self.fn = fn
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_cached = max_cached
+        self.lock = threading.Lock()
+        self.executor = None
+        self.in_flight = {}
+        self.results = {}
+        self.stats = {'renders': 0, 'coalesced': 0, 'cached': 0, 'rejected': 0}
+
+    def _executor(self):
+        if self.executor is None:
+            # Not fork: the server's own threads (state refreshes) may hold locks
+            # mid-pandas when the workers start
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context(method))
+        return self.executor
+
+    def submit(self, *args, version=None):
+        """
+        Future for fn(*args). `version` identifies the data the render depends on
+        (e.g. the CSV size and mtime); a cached result is reused only for the same version.
+        """
+        with self.lock:
+            cached = self.results.get(args)
+            if cached is not None and cached[0] == version:
+                self.stats['cached'] += 1
+                return cached[1]
+            key = (args, version)
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future
+            if len(self.in_flight) >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise RenderPoolBusy()
+            future = self._executor().submit(self.fn, *args)
+            self.in_flight[key] = future
+            self.stats['renders'] += 1
+        future.add_done_callback(lambda f: self._done(args, version, f))
+        return future
+
+    def _done(self, args, version, future):
+        with self.lock:
+            self.in_flight.pop((args, version), None)
+            if not future.cancelled() and future.exception() is None:
+                self.results.pop(args, None)
+                self.results[args] = (version, future)
+                # Arbitrary time windows are distinct args; drop the oldest
+                while len(self.results) > self.max_cached:
+                    self.results.pop(next(iter(self.results)))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
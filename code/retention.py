@@ -0,0 +1,482 @@
+import os
+import csv
+import sys
+import gzip
+import glob
+import shutil
+import argparse
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from row_index import IndexWriter, INDEX_EVERY, index_path
+
+# Rotated and compacted segments live next to the live CSV in history/, named
+#   <stem>.<tier>.<stamp>.csv.gz
+# raw segments are stamped with their rotation time (%Y%m%dT%H%M%S); rollup segments
+# hold one period (a day or a month) each and are stamped with it (%Y%m%d / %Y%m).
+# The stamps of older (coarser) tiers sort before newer ones, so sorting segments by
+# stamp gives one chronological history ending with the live file.
+HISTORY_DIR = 'history'
+SEGMENT_SUFFIX = '.csv.gz'
+RAW_STAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+# name: tier name; freq: rollup bucket (None = raw rows); keep: how long segments stay
+# in this tier before being compacted into the next one (None = forever);
+# period: pandas period that groups rows into one segment file
+Tier = namedtuple('Tier', ['name', 'freq', 'keep', 'period'])
+
+RETENTION_TIERS = [
+    Tier('raw', None, timedelta(hours=24), None),
+    Tier('1min', '1min', timedelta(days=30), 'D'),
+    Tier('1h', '1h', None, 'M'),
+]
+PERIOD_FORMATS = {'D': '%Y%m%d', 'M': '%Y%m'}
+
+# Compaction writes rollups under PENDING_SUFFIX, then commits them by writing a
+# journal of sources and targets (<stem>.compaction in history/) and rolling it
+# forward: sources renamed to HIDDEN_SUFFIX, rollups moved into place, sources
+# deleted, journal removed. A crash at any point is finished on the next start.
+PENDING_SUFFIX = '.pending'
+HIDDEN_SUFFIX = '.compacting'
+
+# Rotate the live file when either limit is reached
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_AGE = timedelta(hours=1)
+
+
+def history_dir(csv_path):
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), HISTORY_DIR)
+
+
+def _stem(csv_path):
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def segment_path(csv_path, tier, stamp):
+    return os.path.join(history_dir(csv_path), f'{_stem(csv_path)}.{tier}.{stamp}{SEGMENT_SUFFIX}')
+
+
+def list_segments(csv_path):
+    """
+    Return (tier, stamp, path) for every history segment of csv_path, oldest first
+    """
+    prefix = _stem(csv_path) + '.'
+    segments = []
+    for path in glob.glob(os.path.join(history_dir(csv_path), prefix + '*' + SEGMENT_SUFFIX)):
+        name = os.path.basename(path)[len(prefix):-len(SEGMENT_SUFFIX)]
+        tier, _, stamp = name.partition('.')
+        if stamp:
+            segments.append((tier, stamp, path))
+    segments.sort(key=lambda s: s[1])
+    return segments
+
+
+def history_paths(csv_path):
+    """
+    All files making up the logical history of csv_path, oldest first (the live file last)
+    """
+    paths = [path for _, _, path in list_segments(csv_path)]
+    if os.path.exists(csv_path) and os.path.getsize(csv_path) > 0:
+        paths.append(csv_path)
+    return paths
+
+
+def first_timestamp(path):
+    """Timestamp of the first row of a CSV (plain or gzipped); None if there is none"""
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rt', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            row = next(reader, None)
+    except FileNotFoundError:
+        # Compacted or rotated away meanwhile
+        return None
+    if not header or not row or 'timestamp' not in header:
+        return None
+    try:
+        return datetime.fromisoformat(row[header.index('timestamp')])
+    except ValueError:
+        return None
+
+
+def _segment_first(tier, stamp, path):
+    """Earliest time a segment's rows can have: its period start, or a raw segment's first row"""
+    if tier.period is None:
+        return first_timestamp(path)
+    return datetime.strptime(stamp, PERIOD_FORMATS[tier.period])
+
+
+def _segment_last(tier, stamp):
+    """A segment's rows are all before this: its period end, or just after the rotation second"""
+    if tier.period is None:
+        return _segment_end(tier, stamp) + timedelta(seconds=1)
+    return _segment_end(tier, stamp)
+
+
+def paths_between(csv_path, start=None, end=None, tiers=RETENTION_TIERS):
+    """
+    Like history_paths(), but only the files that can hold rows with
+    start <= timestamp <= end (datetimes; None leaves that side open).
+
+    Segments are not contiguous in time: a month's 1h rollup sorts before the
+    1min days of the same month that have not been compacted into it yet, so
+    every segment is checked on its own.
+    """
+    by_name = {tier.name: tier for tier in tiers}
+    paths = []
+    for name, stamp, path in list_segments(csv_path):
+        if name not in by_name:
+            paths.append(path)
+            continue
+        tier = by_name[name]
+        if start is not None and _segment_last(tier, stamp) <= start:
+            continue
+        if end is not None:
+            first = _segment_first(tier, stamp, path)
+            if first is not None and first > end:
+                continue
+        paths.append(path)
+    if os.path.exists(csv_path) and os.path.getsize(csv_path) > 0:
+        first = first_timestamp(csv_path) if end is not None else None
+        if first is None or first <= end:
+            paths.append(csv_path)
+    return paths
+
+
+class RotatingCsvWriter:
+    """
+    Append-only CSV writer that rotates the live file by size or age.
+
+    Rotated files are gzip-compressed into history/ as raw segments; on_rotate
+    (if given) is called with the csv path afterwards, e.g. to run compaction. If
+    it returns a thread (see compact_in_background), close() waits for it.
+    The live file gets a sparse row index (see row_index.py) every index_every
+    rows, for range reads; None disables it.
+    """
+
+    def __init__(self, csv_path, header, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, on_rotate=None,
+                 index_every=INDEX_EVERY):
+        self.csv_path = csv_path
+        self.header = header
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.on_rotate = on_rotate
+        self.index_every = index_every
+        self.file = None
+        self.writer = None
+        self.index = None
+        self.started_at = None
+        self.background = []
+        # Finish a compaction interrupted by a crash before anything reads the history
+        recover(csv_path)
+        self._open()
+
+    def _open(self):
+        file_exists = os.path.exists(self.csv_path) and os.path.getsize(self.csv_path) > 0
+        self.started_at = self._first_timestamp() if file_exists else None
+        if not file_exists and os.path.exists(index_path(self.csv_path)):
+            # Left over from a file that is gone
+            os.remove(index_path(self.csv_path))
+        self.file = open(self.csv_path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if not file_exists:
+            self.writer.writerow(self.header)
+            self.file.flush()
+        if self.index_every:
+            self.index = IndexWriter(self.csv_path, self.header, self.index_every)
+
+    def _first_timestamp(self):
+        return first_timestamp(self.csv_path)
+
+    def writerow(self, row):
+        now = datetime.now()
+        if self.started_at is None:
+            self.started_at = now
+        offset = self.file.tell()
+        self.writer.writerow(row)
+        self.file.flush()  # Flush to disk so data is saved immediately
+        try:
+            os.fsync(self.file.fileno())
+        except Exception:
+            pass
+        if self.index is not None:
+            self.index.add(offset, row)
+        if self.file.tell() >= self.max_bytes or (self.max_age is not None and now - self.started_at >= self.max_age):
+            self.rotate(now)
+
+    def rotate(self, now=None):
+        """Compress the live file into history/ and start a fresh one"""
+        now = now or datetime.now()
+        self.file.close()
+        if self.index is not None:
+            # The index only describes the uncompressed live file
+            self.index.close()
+            os.remove(index_path(self.csv_path))
+            self.index = None
+        os.makedirs(history_dir(self.csv_path), exist_ok=True)
+        target = segment_path(self.csv_path, 'raw', now.strftime(RAW_STAMP_FORMAT))
+        tmp = target + '.tmp'
+        with open(self.csv_path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, target)
+        os.remove(self.csv_path)
+        self._open()
+        if self.on_rotate is not None:
+            job = self.on_rotate(self.csv_path)
+            self.background = [t for t in self.background if t.is_alive()]
+            if isinstance(job, threading.Thread):
+                self.background.append(job)
+
+    def close(self):
+        for thread in self.background:
+            thread.join()
+        self.background = []
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+
+def _segment_end(tier, stamp):
+    import pandas as pd
+
+    if tier.period is None:
+        return datetime.strptime(stamp, RAW_STAMP_FORMAT)
+    start = datetime.strptime(stamp, PERIOD_FORMATS[tier.period])
+    return (pd.Period(start, freq=tier.period) + 1).start_time.to_pydatetime()
+
+
+def rollup(df, freq):
+    """
+    Downsample rows into `freq` buckets. Rollup rows keep the raw column layout
+    (bucket start as timestamp, last frame_number) plus a `samples` weight, so
+    rolling up a rollup again stays correctly weighted.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = df.dropna(subset=['timestamp'])
+    weights = df['samples'] if 'samples' in df.columns else pd.Series(1, index=df.index)
+    weights = weights.astype(np.int64)
+    buckets = df['timestamp'].dt.floor(freq)
+    weighted = df[['free_slots', 'occupied_slots', 'occupancy_percent']].astype(np.float64).mul(weights, axis=0)
+    grouped = weighted.groupby(buckets).sum()
+    samples = weights.groupby(buckets).sum()
+    out = grouped.div(samples, axis=0)
+    out['free_slots'] = out['free_slots'].round().astype(np.uint16)
+    out['occupied_slots'] = out['occupied_slots'].round().astype(np.uint16)
+    out['occupancy_percent'] = out['occupancy_percent'].round(3)
+    out['total_slots'] = df['total_slots'].groupby(buckets).last()
+    out['frame_number'] = df['frame_number'].groupby(buckets).last()
+    out['samples'] = samples
+    out.index.name = 'timestamp'
+    out = out.reset_index()
+    return out[['free_slots', 'occupied_slots', 'total_slots', 'occupancy_percent', 'frame_number', 'timestamp', 'samples']]
+
+
+def _write_segment(df, path):
+    from data_loader import TIMESTAMP_FORMAT
+
+    df = df.copy()
+    df['timestamp'] = df['timestamp'].dt.strftime(TIMESTAMP_FORMAT).str[:-3]
+    tmp = path + '.tmp'
+    df.to_csv(tmp, index=False, compression='gzip')
+    os.replace(tmp, path)
+
+
+def _journal_path(csv_path):
+    return os.path.join(history_dir(csv_path), _stem(csv_path) + '.compaction')
+
+
+# One compaction at a time per process
+_compact_lock = threading.Lock()
+
+
+def _roll_forward(csv_path):
+    """
+    Finish the compaction recorded in the journal, if any. Every step can be
+    repeated, so this also completes one interrupted halfway. Without a journal
+    nothing was committed: leftover pending rollups are discarded and the
+    sources, never touched, are compacted again later.
+    """
+    directory = history_dir(csv_path)
+    journal = _journal_path(csv_path)
+    if not os.path.exists(journal):
+        for path in glob.glob(os.path.join(directory, _stem(csv_path) + '.*' + PENDING_SUFFIX + '*')):
+            os.remove(path)
+        return
+    with open(journal) as f:
+        entries = [line.rstrip('\n').split('\t') for line in f if line.strip()]
+    sources = [os.path.join(directory, name) for kind, name in entries if kind == 'source']
+    targets = [os.path.join(directory, name) for kind, name in entries if kind == 'target']
+    # Hide the sources before the rollups holding their rows appear, so a reader
+    # never counts both
+    for path in sources:
+        if os.path.exists(path):
+            os.replace(path, path + HIDDEN_SUFFIX)
+    for path in targets:
+        if os.path.exists(path + PENDING_SUFFIX):
+            os.replace(path + PENDING_SUFFIX, path)
+    for path in sources:
+        if os.path.exists(path + HIDDEN_SUFFIX):
+            os.remove(path + HIDDEN_SUFFIX)
+    os.remove(journal)
+
+
+def recover(csv_path):
+    """Complete or discard a compaction interrupted by a crash"""
+    if os.path.isdir(history_dir(csv_path)):
+        with _compact_lock:
+            _roll_forward(csv_path)
+
+
+def compact(csv_path, tiers=RETENTION_TIERS, now=None):
+    """
+    Move segments that outlived their tier into rollups of the next tier.
+    Rows are merged into the existing period segment of the target tier, if any.
+    Each tier's batch is committed atomically (see PENDING_SUFFIX), so a crash
+    never loses rows or merges a segment twice.
+    Returns the number of segments compacted.
+    """
+    import pandas as pd
+    from data_loader import load_data
+
+    now = now or datetime.now()
+    by_name = {tier.name: tier for tier in tiers}
+    compacted = 0
+    with _compact_lock:
+        _roll_forward(csv_path)
+        for tier, target in zip(tiers, tiers[1:]):
+            due = [(stamp, path) for name, stamp, path in list_segments(csv_path)
+                   if name == tier.name and tier.keep is not None and _segment_end(by_name[name], stamp) <= now - tier.keep]
+            if not due:
+                continue
+            frames = [load_data(path, columns=None, history=False) for _, path in due]
+            rolled = rollup(pd.concat(frames, ignore_index=True), target.freq)
+            fmt = PERIOD_FORMATS[target.period]
+            targets = []
+            for period, rows in rolled.groupby(rolled['timestamp'].dt.to_period(target.period)):
+                path = segment_path(csv_path, target.name, period.start_time.strftime(fmt))
+                if os.path.exists(path):
+                    rows = rollup(pd.concat([load_data(path, columns=None, history=False), rows], ignore_index=True), target.freq)
+                _write_segment(rows, path + PENDING_SUFFIX)
+                targets.append(path)
+
+            journal = _journal_path(csv_path)
+            with open(journal + '.tmp', 'w') as f:
+                for _, path in due:
+                    f.write(f'source\t{os.path.basename(path)}\n')
+                for path in targets:
+                    f.write(f'target\t{os.path.basename(path)}\n')
+            # The commit point
+            os.replace(journal + '.tmp', journal)
+            _roll_forward(csv_path)
+            compacted += len(due)
+    return compacted
+
+
+def compact_in_background(csv_path):
+    """
+    on_rotate hook for RotatingCsvWriter: compact without blocking the writer.
+    Returns the thread, which the writer's close() waits for.
+    """
+    def run():
+        try:
+            count = compact(csv_path)
+            if count:
+                print(f"Compacted {count} history segment(s)")
+        except Exception as e:
+            print("Error during history compaction:", e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def check_ranges():
+    """
+    Time-window reads (data_loader.load_data start/end) against filtering a full
+    read, on five weeks of synthetic history rotated and compacted like a running
+    main.py: a partly filled 1h month, 1min days, raw segments and the live file.
+    Returns the number of windows that differ.
+    """
+    import tempfile
+    from engine import CSV_COLUMNS
+    from data_loader import load_data
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(tmpdir, 'parking_data.csv')
+        writer = RotatingCsvWriter(csv_path, CSV_COLUMNS, max_bytes=float('inf'), max_age=None, index_every=100)
+        t, now, frame = datetime(2026, 1, 1), datetime(2026, 2, 3, 9), 0
+        while t < now:
+            occupied = frame % 300
+            writer.writerow([313 - occupied, occupied, 313, f"{occupied / 313 * 100:.1f}", frame,
+                             t.isoformat(timespec='milliseconds')])
+            frame += 1
+            t += timedelta(minutes=2)
+            if t.hour % 6 == 0 and t.minute == 0:
+                writer.rotate(t)
+        writer.close()
+        compact(csv_path, now=now)
+
+        full = load_data(csv_path)
+        windows = [
+            (datetime(2026, 1, 2), datetime(2026, 1, 2, 12)),      # inside the month's 1h rollup
+            (datetime(2026, 1, 20), datetime(2026, 1, 20, 12)),    # month not yet compacted this far
+            (datetime(2026, 1, 25), datetime(2026, 1, 31, 12)),
+            (None, datetime(2026, 1, 15)),
+            (datetime(2026, 1, 3, 18), datetime(2026, 1, 4, 6)),   # across the rollup / 1min boundary
+            (datetime(2026, 2, 2, 6), datetime(2026, 2, 2, 18)),   # day partly compacted, rest raw
+            (datetime(2026, 2, 3, 5), None),                       # raw and live file
+            (datetime(2026, 2, 10), None),                         # after the data
+        ]
+        failures = 0
+        for start, end in windows:
+            keep = full['timestamp'].notna()
+            if start is not None:
+                keep &= full['timestamp'] >= start
+            if end is not None:
+                keep &= full['timestamp'] <= end
+            expected = full[keep].reset_index(drop=True)
+            got = load_data(csv_path, start=start, end=end)
+            # A window that reads no rollup has no samples column; its rows each count once
+            same = got.equals(expected[got.columns]) and (
+                'samples' in got.columns or 'samples' not in expected or (expected['samples'] == 1).all())
+            same = same or len(got) == len(expected) == 0
+            failures += not same
+            print(f"  {str(start):>19} .. {str(end):<19} {len(got):>6} rows, expected {len(expected):>6}"
+                  f"  {'ok' if same else 'MISMATCH'}")
+        return failures
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rotate and compact parking_data.csv history')
+    parser.add_argument('--csv', default=os.path.join(os.path.dirname(__file__), 'parking_data.csv'))
+    parser.add_argument('--rotate', action='store_true', help='Rotate the live file before compacting')
+    parser.add_argument('--check-ranges', action='store_true',
+                        help='Check time-window reads on synthetic history instead')
+    args = parser.parse_args()
+
+    if args.check_ranges:
+        failures = check_ranges()
+        print('All windows match' if not failures else f'{failures} window(s) differ')
+        return 1 if failures else 0
+
+    if args.rotate and os.path.exists(args.csv):
+        from engine import CSV_COLUMNS
+        writer = RotatingCsvWriter(args.csv, CSV_COLUMNS)
+        writer.rotate()
+        writer.close()
+        print('Rotated', args.csv)
+    count = compact(args.csv)
+    print(f'Compacted {count} segment(s); history now has {len(list_segments(args.csv))} segment(s)')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+# Sparse sidecar index of a CSV file: every INDEX_EVERY rows, the row's timestamp
+# (ms, naive local time like the CSV), frame number, byte offset and row number.
+# RotatingCsvWriter keeps it current for parking_data.csv (parking_data.csv.idx),
+# so a time window can be read by seeking instead of scanning from the start.
+INDEX_SUFFIX = '.idx'
+INDEX_EVERY = 1000
+ENTRY = np.dtype([('t', '<i8'), ('frame', '<i8'), ('offset', '<i8'), ('row', '<i8')])
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def index_path(csv_path):
+    return csv_path + INDEX_SUFFIX
+
+
+def to_ms(timestamp):
+    """Milliseconds since the epoch of a naive datetime or ISO string; None if unparseable"""
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            return None
+    return int((timestamp.replace(tzinfo=None) - EPOCH).total_seconds() * 1000)
+
+
+def _header_fields(line):
+    return line.decode().strip().split(',')
+
+
+def _entry(fields, header, offset, row):
+    t = to_ms(fields[header.index('timestamp')]) if 'timestamp' in header else None
+    try:
+        frame = int(fields[header.index('frame_number')]) if 'frame_number' in header else -1
+    except ValueError:
+        frame = -1
+    if t is None:
+        return None
+    return (t, frame, offset, row)
+
+
+def build_index(csv_path, every=INDEX_EVERY):
+    """Scan csv_path once and write its index; returns (entries, rows)"""
+    entries = []
+    rows = 0
+    with open(csv_path, 'rb') as f:
+        header = _header_fields(f.readline())
+        offset = f.tell()
+        pending = False
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            if pending or rows % every == 0:
+                entry = _entry(line.decode(errors='replace').strip().split(','), header, offset, rows)
+                # A row without a usable timestamp defers its entry to the next row
+                pending = entry is None
+                if entry is not None:
+                    entries.append(entry)
+            rows += 1
+            offset += len(line)
+    entries = np.array(entries, dtype=ENTRY)
+    tmp = index_path(csv_path) + '.tmp'
+    entries.tofile(tmp)
+    os.replace(tmp, index_path(csv_path))
+    return entries, rows
+
+
+def load_index(csv_path):
+    """
+    The index entries of csv_path, or None if there is no index or it does not
+    belong to the current file (e.g. it was replaced). Entries past the end of
+    the file are dropped.
+    """
+    path = index_path(csv_path)
+    if not os.path.exists(path) or not os.path.exists(csv_path):
+        return None
+    entries = np.fromfile(path, dtype=ENTRY)
+    size = os.path.getsize(csv_path)
+    entries = entries[entries['offset'] < size]
+    if len(entries) == 0:
+        return None
+    # Every entry must sit at the start of a line of this file
+    with open(csv_path, 'rb') as f:
+        for offset in (entries['offset'][0], entries['offset'][-1]):
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':
+                return None
+    return entries
+
+
+def byte_range(entries, start_ms=None, end_ms=None):
+    """
+    (first, last) byte offsets that cover every row with start_ms <= t <= end_ms:
+    first is an indexed row at or before the window, last an indexed row after it
+    (None = to the end of the file). Rows in between still need filtering.
+    """
+    # Timestamps only go backwards if the clock did; keep the search monotonic
+    t = np.maximum.accumulate(entries['t'])
+    first = entries['offset'][0]
+    if start_ms is not None:
+        i = np.searchsorted(t, start_ms, side='right') - 1
+        first = entries['offset'][max(i, 0)]
+    last = None
+    if end_ms is not None:
+        j = np.searchsorted(t, end_ms, side='right')
+        if j < len(entries):
+            last = entries['offset'][j]
+    return int(first), (int(last) if last is not None else None)
+
+
+class IndexWriter:
+    """
+    Appends an index entry every `every` rows as a CSV is written. Picks up an
+    existing index (rebuilding it if it is missing or stale) so appending to a
+    file across runs keeps one index.
+    """
+
+    def __init__(self, csv_path, header, every=INDEX_EVERY):
+        self.csv_path = csv_path
+        self.header = list(header)
+        self.every = every
+        self.rows = 0
+        self.pending = False
+        self.file = None
+        if os.path.exists(csv_path) and os.path.getsize(csv_path) > 0:
+            entries = load_index(csv_path)
+            if entries is None:
+                _, self.rows = build_index(csv_path, every)
+            else:
+                self.rows = int(entries['row'][-1]) + self._count_rows(entries['offset'][-1])
+        self.file = open(index_path(csv_path), 'ab')
+
+    def _count_rows(self, offset):
+        with open(self.csv_path, 'rb') as f:
+            f.seek(offset)
+            return f.read().count(b'\n')
+
+    def add(self, offset, row):
+        """Record a row that was just written starting at byte `offset`"""
+        if self.pending or self.rows % self.every == 0:
+            entry = _entry([str(v) for v in row], self.header, offset, self.rows)
+            self.pending = entry is None
+            if entry is not None:
+                np.array([entry], dtype=ENTRY).tofile(self.file)
+                self.file.flush()
+        self.rows += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or inspect the sparse row index of a telemetry CSV')
+    parser.add_argument('csv')
+    parser.add_argument('--every', type=int, default=INDEX_EVERY)
+    parser.add_argument('--show', action='store_true', help='Print the existing index instead of rebuilding it')
+    args = parser.parse_args()
+
+    if args.show:
+        entries = load_index(args.csv)
+        if entries is None:
+            print("No valid index for", args.csv)
+            return 1
+    else:
+        entries, rows = build_index(args.csv, args.every)
+        print(f"Indexed {rows} rows of {args.csv}: {len(entries)} entries")
+    for t, frame, offset, row in entries[:20]:
+        print(f"  row {row:>9}  frame {frame:>8}  offset {offset:>12}  {np.datetime64(int(t), 'ms')}")
+    if len(entries) > 20:
+        print(f"  ... {len(entries) - 20} more")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Frames compared per step when extracting transitions from a dense matrix;
+# bounds memory for memory-mapped stores of any length
+CHUNK_FRAMES = 65_536
+
+# Slots occupied less than this fraction of the time are reported as underutilized
+UNDERUTILIZED_BELOW = 0.3
+
+MS_PER_HOUR = 3_600_000
+
+
+class Transitions:
+    """
+    Per-slot occupancy as state changes: at time t[i] (ms since epoch) slot[i]
+    became state[i] (0 = free, 1 = occupied). Events are in time order. `initial`
+    is every slot's state at `start`; the observation window ends at `end`.
+    """
+
+    def __init__(self, t, slot, state, initial, start, end):
+        self.t = np.asarray(t, dtype=np.int64)
+        self.slot = np.asarray(slot, dtype=np.int64)
+        self.state = np.asarray(state, dtype=np.uint8)
+        self.initial = np.asarray(initial, dtype=np.uint8)
+        self.start = int(start)
+        self.end = int(end)
+
+    @property
+    def slots(self):
+        return len(self.initial)
+
+    def __len__(self):
+        return len(self.t)
+
+    @classmethod
+    def from_dense(cls, t_ms, occupancy, chunk_frames=CHUNK_FRAMES):
+        """
+        From a (frames, slots) uint8 matrix and its frame timestamps, e.g. the output
+        of engine.load_binary_store(). Works through the matrix in chunks, so a
+        memory-mapped store is never loaded whole.
+        """
+        frames = len(t_ms)
+        if frames == 0:
+            raise ValueError("No frames")
+        prev = np.asarray(occupancy[0])
+        initial = prev.copy()
+        ts, slots, states = [], [], []
+        for first in range(1, frames, chunk_frames):
+            block = np.asarray(occupancy[first:first + chunk_frames])
+            changed = np.empty(block.shape, dtype=bool)
+            np.not_equal(block[0], prev, out=changed[0])
+            np.not_equal(block[1:], block[:-1], out=changed[1:])
+            # Most frames change nothing; only scan the rows that do. Row-major
+            # order, so events come out sorted by time
+            active = np.flatnonzero(changed.any(axis=1))
+            rows, cols = np.nonzero(changed[active])
+            rows = active[rows]
+            ts.append(np.asarray(t_ms[first:first + chunk_frames])[rows])
+            slots.append(cols)
+            states.append(block[rows, cols])
+            prev = block[-1]
+        if not ts:
+            ts, slots, states = [np.empty(0, np.int64)], [np.empty(0, np.int64)], [np.empty(0, np.uint8)]
+        return cls(np.concatenate(ts), np.concatenate(slots), np.concatenate(states),
+                   initial, t_ms[0], t_ms[frames - 1])
+
+    @classmethod
+    def from_events(cls, t, slot, state, slots, start=None, end=None, initial=None):
+        """
+        From raw (t, slot, state) events in any order. Events that repeat a slot's
+        current state are dropped; slots start free unless `initial` is given.
+        """
+        t = np.asarray(t, dtype=np.int64)
+        slot = np.asarray(slot, dtype=np.int64)
+        state = np.asarray(state, dtype=np.uint8)
+        initial = np.zeros(slots, dtype=np.uint8) if initial is None else np.asarray(initial, dtype=np.uint8)
+        start = int(t.min()) if start is None else start
+        end = int(t.max()) if end is None else end
+
+        order = np.lexsort((t, slot))
+        t, slot, state = t[order], slot[order], state[order]
+        previous = np.empty_like(state)
+        if len(state):
+            previous[1:] = state[:-1]
+            first = np.ones(len(slot), dtype=bool)
+            first[1:] = slot[1:] != slot[:-1]
+            previous[first] = initial[slot[first]]
+        keep = state != previous
+        t, slot, state = t[keep], slot[keep], state[keep]
+        by_time = np.argsort(t, kind='stable')
+        return cls(t[by_time], slot[by_time], state[by_time], initial, start, end)
+
+
+def runs(tr):
+    """
+    Every slot's runs of constant state, grouped by slot and in time order.
+    Returns (slot, state, start_ms, duration_ms, censored) arrays; censored runs
+    were already going at the window start or still going at its end.
+    """
+    n = tr.slots
+    # Each slot's initial state is a pseudo-event at the window start
+    slot = np.concatenate([np.arange(n), tr.slot])
+    t = np.concatenate([np.full(n, tr.start, dtype=np.int64), tr.t])
+    state = np.concatenate([tr.initial, tr.state])
+    # Stable sort by slot keeps time order within each slot (pseudo-events first)
+    order = np.argsort(slot, kind='stable')
+    slot, t, state = slot[order], t[order], state[order]
+
+    last = np.ones(len(slot), dtype=bool)
+    last[:-1] = slot[1:] != slot[:-1]
+    next_t = np.empty_like(t)
+    next_t[:-1] = t[1:]
+    next_t[last] = tr.end
+    first = np.ones(len(slot), dtype=bool)
+    first[1:] = slot[1:] != slot[:-1]
+    return slot, state, t, next_t - t, first | last
+
+
+def grouped_percentiles(values, groups, n_groups, percentiles):
+    """
+    Percentiles of `values` within each group (linear interpolation, as
+    np.percentile); nan for empty groups. Returns shape (n_groups, len(percentiles)).
+    """
+    order = np.lexsort((values, groups))
+    values = values[order].astype(np.float64)
+    counts = np.bincount(groups, minlength=n_groups)
+    offsets = np.cumsum(counts) - counts
+    out = np.full((n_groups, len(percentiles)), np.nan)
+    has = counts > 0
+    for j, p in enumerate(percentiles):
+        pos = offsets[has] + (counts[has] - 1) * (p / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, offsets[has] + counts[has] - 1)
+        frac = pos - lo
+        out[has, j] = values[lo] + (values[hi] - values[lo]) * frac
+    return out
+
+
+def slot_summary(tr, percentiles=(50, 90), include_censored=False):
+    """
+    Per-slot DataFrame: utilization (fraction of time occupied), visits (arrivals),
+    turnover_per_hour, dwell_mean_s and dwell_p<N>_s. Dwell statistics use complete
+    occupied runs only, unless include_censored.
+    """
+    n = tr.slots
+    slot, state, _, duration, censored = runs(tr)
+    window = max(tr.end - tr.start, 1)
+    occupied_time = np.bincount(slot, weights=duration * state, minlength=n)
+
+    arrivals = np.bincount(tr.slot[tr.state == 1], minlength=n)
+    hours = window / MS_PER_HOUR
+
+    dwell = (state == 1) & (duration > 0)
+    if not include_censored:
+        dwell &= ~censored
+    dwell_slot, dwell_s = slot[dwell], duration[dwell] / 1000.0
+    dwell_count = np.bincount(dwell_slot, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dwell_mean = np.bincount(dwell_slot, weights=dwell_s, minlength=n) / dwell_count
+
+    summary = pd.DataFrame({
+        'utilization': occupied_time / window,
+        'visits': arrivals,
+        'turnover_per_hour': arrivals / hours,
+        'dwell_count': dwell_count,
+        'dwell_mean_s': dwell_mean,
+    }, index=pd.RangeIndex(n, name='slot'))
+    pct = grouped_percentiles(dwell_s, dwell_slot, n, percentiles)
+    for j, p in enumerate(percentiles):
+        summary[f'dwell_p{p:g}_s'] = pct[:, j]
+    return summary
+
+
+def lot_dwell_percentiles(tr, percentiles=(50, 90, 99), include_censored=False):
+    """Dwell-time percentiles in seconds over all slots together"""
+    _, state, _, duration, censored = runs(tr)
+    dwell = (state == 1) & (duration > 0)
+    if not include_censored:
+        dwell &= ~censored
+    if not dwell.any():
+        return pd.Series(np.nan, index=[f'p{p:g}' for p in percentiles])
+    return pd.Series(np.percentile(duration[dwell] / 1000.0, percentiles), index=[f'p{p:g}' for p in percentiles])
+
+
+def local_ms(t_ms):
+    """
+    Epoch milliseconds as naive local-time milliseconds, the clock the CSV's
+    timestamps use. The UTC offset is looked up once per hour, so DST is followed.
+    """
+    t_ms = np.asarray(t_ms, dtype=np.int64)
+    hours, inverse = np.unique(t_ms // MS_PER_HOUR, return_inverse=True)
+    offsets = np.array([(datetime.fromtimestamp(h * 3600) - datetime(1970, 1, 1)).total_seconds() - h * 3600
+                        for h in hours.tolist()], dtype=np.int64) * 1000
+    return t_ms + offsets[inverse].reshape(t_ms.shape)
+
+
+def hourly_turnover(tr):
+    """Arrivals across the lot per local clock hour, indexed by the hour's start"""
+    arrivals = local_ms(tr.t[tr.state == 1]) // MS_PER_HOUR
+    first, last = local_ms([tr.start, tr.end]) // MS_PER_HOUR
+    counts = np.bincount(arrivals - first, minlength=last - first + 1)
+    index = pd.to_datetime((first + np.arange(len(counts))) * MS_PER_HOUR, unit='ms')
+    return pd.Series(counts, index=index, name='arrivals')
+
+
+def underutilized(summary, below=UNDERUTILIZED_BELOW):
+    """Utilization of the slots occupied less than `below` of the time, lowest first"""
+    usage = summary['utilization']
+    return usage[usage < below].sort_values()
+
+
+def synthetic_store(path, frames, slots, fps=10.0, mean_dwell_s=1800.0, mean_gap_s=900.0, seed=0,
+                    chunk_frames=CHUNK_FRAMES):
+    """
+    Write a BinaryStoreSink-format file of `frames` frames where each slot alternates
+    between exponentially distributed occupied and free spells
+    """
+    from engine import BinaryStoreSink, record_dtype
+
+    rng = np.random.default_rng(seed)
+    dtype = record_dtype(slots)
+    with open(path, 'wb') as f:
+        np.array([BinaryStoreSink.MAGIC, slots], dtype='<i8').tofile(f)
+    records = np.memmap(path, dtype=dtype, mode='r+', offset=16, shape=(frames,))
+    t0 = 1_700_000_000_000
+    frame_ms = 1000.0 / fps
+
+    state = (rng.random(slots) < mean_dwell_s / (mean_dwell_s + mean_gap_s)).astype(np.uint8)
+    # Frames left in each slot's current spell
+    remaining = rng.exponential(np.where(state == 1, mean_dwell_s, mean_gap_s) * fps).astype(np.int64) + 1
+    for first in range(0, frames, chunk_frames):
+        count = min(chunk_frames, frames - first)
+        toggles = np.zeros((count, slots), dtype=np.uint8)
+        # Place every spell boundary that falls in this chunk
+        while True:
+            inside = remaining < count
+            if not inside.any():
+                break
+            cols = np.flatnonzero(inside)
+            toggles[remaining[cols], cols] ^= 1
+            state[cols] ^= 1
+            remaining[cols] += rng.exponential(np.where(state[cols] == 1, mean_dwell_s, mean_gap_s) * fps).astype(np.int64) + 1
+        remaining -= count
+        block = np.bitwise_xor.accumulate(toggles, axis=0)
+        # Undo this chunk's toggles to get the state at its first frame
+        block ^= (state ^ block[-1])[None, :]
+        records['occupancy'][first:first + count] = block
+        records['t'][first:first + count] = t0 + np.rint((first + np.arange(count)) * frame_ms).astype(np.int64)
+    records.flush()
+    del records
+
+
+def _reference(t_ms, occupancy):
+    """Per-slot (utilization, complete dwells in seconds) with plain Python loops"""
+    result = []
+    window = t_ms[-1] - t_ms[0]
+    for s in range(occupancy.shape[1]):
+        column = occupancy[:, s]
+        occupied = 0
+        dwells = []
+        run_start = 0
+        for i in range(1, len(column) + 1):
+            if i == len(column) or column[i] != column[run_start]:
+                end_t = t_ms[i] if i < len(column) else t_ms[-1]
+                if column[run_start] == 1:
+                    occupied += end_t - t_ms[run_start]
+                    if run_start > 0 and i < len(column):
+                        dwells.append((end_t - t_ms[run_start]) / 1000.0)
+                run_start = i
+        result.append((occupied / window, dwells))
+    return result
+
+
+def benchmark(frames, slots, path=None):
+    from engine import load_binary_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = path or os.path.join(tmp, 'slots.bin')
+        started = time.perf_counter()
+        synthetic_store(path, frames, slots)
+        print(f"Synthetic store: {frames:,} frames x {slots} slots "
+              f"({os.path.getsize(path) / 1e6:.0f} MB) in {time.perf_counter() - started:.1f} s")
+
+        t_ms, occupancy = load_binary_store(path)
+        started = time.perf_counter()
+        tr = Transitions.from_dense(t_ms, occupancy)
+        t_events = time.perf_counter() - started
+        started = time.perf_counter()
+        summary = slot_summary(tr)
+        t_summary = time.perf_counter() - started
+        print(f"  Transitions: {len(tr):,} in {t_events:.2f} s "
+              f"({frames / t_events / 1e6:.1f} M frames/s)")
+        print(f"  Slot summary: {t_summary * 1000:.0f} ms")
+        print(f"  Mean utilization {summary['utilization'].mean():.3f}, "
+              f"median dwell {summary['dwell_p50_s'].median():.0f} s, "
+              f"turnover {summary['turnover_per_hour'].mean():.2f}/slot/h")
+
+        # Check against plain loops on a small store with short spells, and time
+        # pandas long format on it
+        sample = min(frames, 20_000)
+        check_path = os.path.join(tmp, 'check.bin')
+        synthetic_store(check_path, sample, slots, mean_dwell_s=60.0, mean_gap_s=30.0, seed=1)
+        t_s, occ_s = load_binary_store(check_path, mmap=False)
+        small = slot_summary(Transitions.from_dense(t_s, occ_s), percentiles=(50,))
+        ref = _reference(t_s, occ_s)
+        assert np.allclose(small['utilization'], [u for u, _ in ref])
+        assert np.allclose(small['dwell_count'], [len(d) for _, d in ref])
+        assert np.allclose(small['dwell_p50_s'], [np.median(d) if d else np.nan for _, d in ref], equal_nan=True)
+        print(f"  Matches a plain-loop reference on {sample:,} frames of short spells")
+
+        started = time.perf_counter()
+        long = pd.DataFrame({'slot_id': np.tile(np.arange(slots), sample), 'occupied': occ_s.ravel()})
+        long.groupby('slot_id')['occupied'].mean()
+        t_long = time.perf_counter() - started
+        started = time.perf_counter()
+        slot_summary(Transitions.from_dense(t_s, occ_s))
+        t_dense = time.perf_counter() - started
+        print(f"  {sample:,} frames: pandas long-format utilization {t_long * 1000:.0f} ms, "
+              f"full dense summary {t_dense * 1000:.0f} ms")
+        del t_ms, occupancy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-slot utilization, dwell and turnover analytics')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rep = sub.add_parser('report', help='Summarize a slot occupancy store (see PARKING_SLOT_STORE in main.py)')
+    rep.add_argument('store')
+    rep.add_argument('--below', type=float, default=UNDERUTILIZED_BELOW, help='underutilized threshold')
+    bench = sub.add_parser('bench', help='Benchmark on a synthetic store')
+    bench.add_argument('--frames', type=int, default=2_000_000)
+    bench.add_argument('--slots', type=int, default=313)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.frames, args.slots)
+        return
+
+    from engine import load_binary_store
+
+    t_ms, occupancy = load_binary_store(args.store)
+    if len(t_ms) == 0:
+        print("No frames in", args.store)
+        return
+    tr = Transitions.from_dense(t_ms, occupancy)
+    summary = slot_summary(tr)
+    with pd.option_context('display.max_rows', 20, 'display.width', 120):
+        print(summary)
+        print("\nLot dwell time (s):")
+        print(lot_dwell_percentiles(tr))
+        print(f"\nUnderutilized slots (<{args.below:.0%} occupied):")
+        print(underutilized(summary, args.below))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
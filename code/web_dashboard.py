@@ -1,119 +1,273 @@
-import io
 import os
-from flask import Flask, render_template, make_response
+import copy
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import Flask, Response, render_template, make_response, jsonify, request
 import pandas as pd
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
+
+from data_loader import read_latest, parse_time
+from forecast import SeasonalForecaster, FORECAST_PATH
+from mjpeg_stream import MjpegBroadcaster, StreamFull, BOUNDARY
+from plots import render
+from render_pool import RenderPool, RenderPoolBusy
 
 app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), 'templates'))
 CSV_PATH = os.path.join(os.path.dirname(__file__), 'parking_data.csv')
 
+# Worker threads of the production server (waitress)
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 16))
+
+# Annotated lot view published by main.py (see PARKING_ANNOTATED_BUS there).
+# STREAM_WIDTH/STREAM_HEIGHT of 0 keep the source size (aspect kept if only one is set).
+# Every viewer holds a server thread while watching, so STREAM_CLIENTS (default half
+# the threads) caps them and the other routes always have threads left.
+stream = MjpegBroadcaster(
+    os.environ.get('PARKING_ANNOTATED_BUS', 'parking_annotated'),
+    width=int(os.environ.get('STREAM_WIDTH', 960)),
+    height=int(os.environ.get('STREAM_HEIGHT', 0)),
+    fps=float(os.environ.get('STREAM_FPS', 10)),
+    quality=int(os.environ.get('STREAM_QUALITY', 80)),
+    max_clients=int(os.environ.get('STREAM_CLIENTS', max(1, SERVER_THREADS // 2))),
+)
+
+# Plots are rendered in worker processes so matplotlib never holds the server's GIL.
+# Identical in-flight renders are shared; when RENDER_QUEUE distinct renders are
+# already pending, plot requests get 503 instead of piling up.
+pool = RenderPool(
+    render,
+    max_workers=int(os.environ.get('RENDER_WORKERS', 2)),
+    max_pending=int(os.environ.get('RENDER_QUEUE', 8)),
+)
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 30))
+
+
+class LiveState:
+    """
+    Latest CSV row, kept in memory by a background thread so the JSON routes
+    answer without touching the disk or pandas
+    """
 
-def read_data():
-    if not os.path.exists(CSV_PATH):
-        return pd.DataFrame()
-    df = pd.read_csv(CSV_PATH)
-    if 'timestamp' in df.columns:
+    def __init__(self, csv_path, interval=0.5):
+        self.csv_path = csv_path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.latest = None
+        self.version = None
+        self.updated = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.refresh()
+                self.thread = threading.Thread(target=self._loop, daemon=True)
+                self.thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Error reading latest row:", e)
+
+    def refresh(self):
         try:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        except Exception:
-            pass
-    if 'occupancy_percent' in df.columns:
-        df['occupancy_percent'] = pd.to_numeric(df['occupancy_percent'], errors='coerce')
-    return df
-
-
-def fig_to_png_response(fig):
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    response = make_response(buf.read())
+            st = os.stat(self.csv_path)
+            version = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            version = None
+        if version != self.version:
+            self.latest = read_latest(self.csv_path) if version else None
+            self.version = version
+        self.updated = time.time()
+
+    def snapshot(self):
+        self.start()
+        return self.latest, self.version
+
+
+class ForecastState:
+    """
+    Seasonal forecaster, refreshed with new rows in the background every
+    `interval` seconds and saved for the plot workers. Queries only look up the table.
+    """
+
+    def __init__(self, csv_path, path=FORECAST_PATH, interval=60):
+        self.csv_path = csv_path
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.forecaster = SeasonalForecaster.load_or_new(path)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, daemon=True)
+                self.thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Error refreshing forecast:", e)
+            time.sleep(self.interval)
+
+    def refresh(self):
+        # Update a copy and swap it in, so queries never see a half-updated table
+        forecaster = copy.deepcopy(self.forecaster)
+        if forecaster.refresh(self.csv_path):
+            forecaster.save(self.path)
+            self.forecaster = forecaster
+
+    def get(self):
+        self.start()
+        return self.forecaster
+
+
+live = LiveState(CSV_PATH)
+forecasts = ForecastState(CSV_PATH, interval=float(os.environ.get('FORECAST_REFRESH', 60)))
+started = time.time()
+
+
+def png_response(data):
+    response = make_response(data)
     response.headers.set('Content-Type', 'image/png')
     return response
 
 
+def render_plot(name):
+    """
+    PNG of a plot; ?start= and ?end= (ISO times, or relative like -2h) restrict it
+    to a time window, read by seeking rather than loading the whole history
+    """
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    try:
+        parse_time(start), parse_time(end)
+    except ValueError:
+        return make_response('start and end must be ISO timestamps or like -2h', 400)
+    _, version = live.snapshot()
+    try:
+        # Relative windows are resolved in the worker, so they stay one cache key
+        data = pool.submit(name, CSV_PATH, start, end, version=version).result(timeout=RENDER_TIMEOUT)
+    except (RenderPoolBusy, FutureTimeout):
+        response = make_response('Render queue full, try again shortly', 503)
+        response.headers.set('Retry-After', '1')
+        return response
+    return png_response(data)
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 
+@app.route('/stream.mjpg')
+def stream_mjpg():
+    try:
+        frames = stream.subscribe()
+    except StreamFull:
+        response = make_response('Too many live viewers, try again later', 503)
+        response.headers.set('Retry-After', '10')
+        return response
+    return Response(frames, mimetype=f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+
+
 @app.route('/plot/occupancy.png')
 def plot_occupancy():
-    df = read_data()
-    fig, ax = plt.subplots(figsize=(10, 4))
-    if df.empty or 'occupancy_percent' not in df.columns:
-        ax.text(0.5, 0.5, 'No data available', ha='center', va='center')
-    else:
-        x = df['timestamp'] if 'timestamp' in df.columns else np.arange(len(df))
-        y = df['occupancy_percent']
-        ax.plot(x, y, marker='.', linewidth=1)
-        ax.set_title('Occupancy % vs Time')
-        ax.set_ylabel('Occupancy (%)')
-        if 'timestamp' in df.columns:
-            ax.xaxis.set_major_formatter(DateFormatter('%H:%M:%S'))
-            fig.autofmt_xdate()
-        ax.grid(alpha=0.3)
-    resp = fig_to_png_response(fig)
-    plt.close(fig)
-    return resp
+    return render_plot('occupancy')
 
 
 @app.route('/plot/bar.png')
 def plot_bar():
-    df = read_data()
-    fig, ax = plt.subplots(figsize=(6, 4))
-    if df.empty or 'free_slots' not in df.columns:
-        ax.text(0.5, 0.5, 'No data available', ha='center', va='center')
-    else:
-        last = df.iloc[-1]
-        free = last['free_slots']
-        occ = last['occupied_slots']
-        bars = ax.bar(['Free', 'Occupied'], [free, occ], color=['green', 'red'])
-        ax.set_title('Current Free vs Occupied')
-        for bar in bars:
-            y = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2, y, f'{y:.0f}', ha='center', va='bottom')
-    resp = fig_to_png_response(fig)
-    plt.close(fig)
-    return resp
+    return render_plot('bar')
 
 
 @app.route('/plot/moving.png')
 def plot_moving():
-    df = read_data()
-    fig, ax = plt.subplots(figsize=(10, 4))
-    if df.empty or 'occupancy_percent' not in df.columns:
-        ax.text(0.5, 0.5, 'No data available', ha='center', va='center')
-    else:
-        series = df['occupancy_percent'].astype(float).reset_index(drop=True)
-        ma = series.rolling(window=min(30, len(series)), min_periods=1).mean()
-        idx = np.arange(len(series))
-        ax.plot(idx, series, label='raw', alpha=0.4)
-        ax.plot(idx, ma, label='MA (30)', linewidth=2)
-        n_fit = min(200, len(series))
-        if n_fit >= 2:
-            x_fit = np.arange(n_fit)
-            y_fit = series.iloc[-n_fit:].values
-            coeffs = np.polyfit(x_fit, y_fit, 1)
-            poly = np.poly1d(coeffs)
-            x_fore = np.arange(len(series), len(series) + 30)
-            x_fore_fit = x_fit[-1] + (x_fore - len(series) + 1)
-            y_fore = poly(x_fore_fit)
-            ax.plot(x_fore, y_fore, '--', color='orange', label='forecast')
-        ax.set_title('Moving Average + Forecast')
-        ax.set_xlabel('Frame index')
-        ax.set_ylabel('Occupancy (%)')
-        ax.legend()
-        ax.grid(alpha=0.3)
-    resp = fig_to_png_response(fig)
-    plt.close(fig)
-    return resp
+    return render_plot('moving')
+
+
+@app.route('/api/latest')
+def api_latest():
+    row, _ = live.snapshot()
+    if row is None:
+        return jsonify({}), 404
+    row = dict(row)
+    if row.get('timestamp') is not None:
+        row['timestamp'] = row['timestamp'].isoformat()
+    return jsonify(row)
+
+
+@app.route('/api/forecast')
+def api_forecast():
+    """Expected occupancy % over the next ?minutes= (default 60) every ?step= minutes (default 5)"""
+    try:
+        minutes = int(request.args.get('minutes', 60))
+        step = int(request.args.get('step', 5))
+    except ValueError:
+        return jsonify({'error': 'minutes and step must be integers'}), 400
+    if not 1 <= minutes <= 7 * 24 * 60 or not 1 <= step <= minutes:
+        return jsonify({'error': 'need 1 <= step <= minutes <= 10080'}), 400
+    forecaster = forecasts.get()
+    if not forecaster.trained:
+        return jsonify({'error': 'forecaster not trained yet'}), 503
+    times, values = forecaster.forecast_values(minutes, step, start=pd.Timestamp.now())
+    return jsonify({
+        'trained_until': forecaster.trained_until.isoformat(),
+        'step_minutes': step,
+        'forecast': [{'timestamp': str(t)[:19], 'occupancy_percent': round(float(v), 1)}
+                     for t, v in zip(times.astype('datetime64[s]'), values)],
+    })
+
+
+@app.route('/api/health')
+def api_health():
+    row, version = live.snapshot()
+    return jsonify({
+        'status': 'ok',
+        'uptime': round(time.time() - started, 1),
+        'has_data': row is not None,
+        'data_age': round(time.time() - version[1] / 1e9, 1) if version else None,
+        'stream_clients': stream.clients,
+        'render': dict(pool.stats, pending=len(pool.in_flight)),
+        'forecast_trained_until': str(forecasts.forecaster.trained_until),
+    })
+
+
+# port: the bound port (useful with port=0); run(): serve until stop() is called
+Server = namedtuple('Server', ['port', 'run', 'stop'])
+
+
+def create_server(host='0.0.0.0', port=5000, threads=SERVER_THREADS):
+    """
+    The HTTP server serve() runs: waitress (see requirements.txt) if it is
+    installed, else werkzeug's threaded server, as used by Flask's app.run. Either
+    way, each request gets its own thread and blocks only on its own render.
+    """
+    try:
+        from waitress import create_server as waitress_server
+    except ImportError:
+        from werkzeug.serving import make_server
+        print("waitress not installed, using Flask's threaded server")
+        server = make_server(host, port, app, threaded=True)
+        return Server(server.server_port, server.serve_forever, server.shutdown)
+    server = waitress_server(app, host=host, port=port, threads=threads)
+    return Server(server.effective_port, server.run, server.close)
+
+
+def serve(host='0.0.0.0', port=5000, threads=SERVER_THREADS):
+    live.start()
+    forecasts.start()
+    create_server(host, port, threads).run()
 
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print('Starting web dashboard on http://127.0.0.1:%d' % port)
-    app.run(host='0.0.0.0', port=port, debug=False)
+    serve(port=port)